@@ -0,0 +1,85 @@
+import contextlib
+import warnings
+
+import torch as T
+
+MODES = ('script', 'compile')
+
+
+@contextlib.contextmanager
+def jit_autocast_disabled():
+    # TorchScript 자체 autocast pass는 grad가 필요한 입력과 끊긴 graph를 만들 때가 있어서 끔;
+    # trace의 aten 연산은 dispatcher의 autocast로 그대로 bfloat16이 됨.
+    # 프로세스 전체 설정이므로 나올 때 이전 값으로 되돌림
+    if not hasattr(T._C, '_jit_set_autocast_mode'):
+        yield
+        return
+    previous = T._C._jit_set_autocast_mode(False)
+    try:
+        yield
+    finally:
+        T._C._jit_set_autocast_mode(previous)
+
+
+class Accelerator:
+    """Runs network forward passes as TorchScript traces ('script') or
+    torch.compile graphs ('compile'), optionally under bfloat16 autocast on CPU.
+
+        accelerator = Accelerator('script', bf16=True)
+        pi = accelerator(agent.actor, state)     # instead of agent.actor.forward(state)
+
+    mode=None keeps eager forward passes (bf16 only). One graph is built per
+    (network, input shapes), i.e. per batch size and agent count, on first use
+    and reused afterwards. Traces share the network's
+    parameters, so optimizer steps and soft updates are picked up without
+    re-tracing. With bf16 the weights and optimizer state stay float32 (autocast
+    casts per op) and outputs are returned as float32 for the losses.
+
+    torch.compile needs torch 2, CPU bfloat16 autocast torch 1.10; both raise
+    ValueError on older versions. 'script' works on any supported torch.
+    """
+    def __init__(self, mode='script', bf16=False):
+        if mode is not None and mode not in MODES:
+            raise ValueError('mode must be one of {}'.format(MODES))
+        if mode == 'compile' and not hasattr(T, 'compile'):
+            raise ValueError("mode='compile' needs torch.compile (torch 2.0 or later)")
+        if bf16 and not hasattr(T, 'autocast'):
+            raise ValueError('bf16 needs torch.autocast on CPU (torch 1.10 or later)')
+        self.mode = mode
+        self.bf16 = bf16
+        self.graphs = {}
+
+    def __call__(self, network, *inputs):
+        key = (id(network),) + tuple(tuple(x.shape) for x in inputs)
+        graph = self.graphs.get(key)
+        if graph is None:
+            graph = self.graphs[key] = self.build(network, inputs)
+
+        if not self.bf16:
+            return graph(*inputs)
+        with self.autocast(network.device), self.executor():
+            output = graph(*inputs)
+        return output.float()
+
+    def build(self, network, inputs):
+        if self.mode is None:
+            return network.forward
+        if self.mode == 'compile':
+            return T.compile(network, dynamic=False)
+        # 추적 중에는 parameter가 상수로 들어가지 않도록 grad 기록 없이
+        with T.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning) # torch 2의 jit.trace deprecation
+            return T.jit.trace(network, inputs, check_trace=False)
+
+    def executor(self):
+        # trace의 autodiff graph는 autocast가 넣은 bfloat16 cast를 backward에서 빠뜨려서
+        # (nn.Linear의 grad_input matmul이 bfloat16 x float32) 최적화 없이 eager autograd로 실행
+        if self.mode == 'script':
+            stack = contextlib.ExitStack()
+            stack.enter_context(T.jit.optimized_execution(False))
+            stack.enter_context(jit_autocast_disabled())
+            return stack
+        return contextlib.nullcontext()
+
+    def autocast(self, device):
+        return T.autocast(device.type, dtype=T.bfloat16)
@@ -1,34 +1,64 @@
 import torch as T
-from networks import ActorNetwork, CriticNetwork
+from networks import ActorNetwork, CriticNetwork, ActorEnsemble, CriticEnsemble, \
+                     SharedActorNetwork, SharedCriticNetwork
+
+
+def soft_update(target_params, params, tau):
+    # target <- tau*param + (1-tau)*target, in place over flat lists of tensors
+    with T.no_grad():
+        if tau == 1:
+            for target_param, param in zip(target_params, params):
+                target_param.copy_(param)
+        elif hasattr(T, '_foreach_lerp_'):
+            T._foreach_lerp_(target_params, params, tau)
+        else:
+            for target_param, param in zip(target_params, params):
+                target_param.lerp_(param, tau)
 
 class Agent:
     def __init__(self, actor_dims, critic_dims, n_actions, n_agents, agent_idx, chkpt_dir,
                     alpha=0.01, beta=0.01, fc1=64, 
-                    fc2=64, gamma=0.95, tau=0.01):
+                    fc2=64, gamma=0.95, tau=0.01, encoders=None):
+        # encoders: {'actor', 'critic', 'target_actor', 'target_critic'} -> GridEncoder
+        # shared with the other agents (see MADDPG network='cnn'), None for plain MLPs
+        encoders = encoders or {}
         self.gamma = gamma
         self.tau = tau
         self.n_actions = n_actions
         self.agent_name = 'agent_%s' % agent_idx
         self.actor = ActorNetwork(alpha, actor_dims, fc1, fc2, n_actions, 
-                                  chkpt_dir=chkpt_dir,  name=self.agent_name+'_actor')
+                                  chkpt_dir=chkpt_dir,  name=self.agent_name+'_actor',
+                                  encoder=encoders.get('actor'))
         self.critic = CriticNetwork(beta, critic_dims, 
                             fc1, fc2, n_agents, n_actions, 
-                            chkpt_dir=chkpt_dir, name=self.agent_name+'_critic')
+                            chkpt_dir=chkpt_dir, name=self.agent_name+'_critic',
+                            encoder=encoders.get('critic'))
         self.target_actor = ActorNetwork(alpha, actor_dims, fc1, fc2, n_actions,
                                         chkpt_dir=chkpt_dir, 
-                                        name=self.agent_name+'_target_actor')
+                                        name=self.agent_name+'_target_actor',
+                                        encoder=encoders.get('target_actor'))
         self.target_critic = CriticNetwork(beta, critic_dims, 
                                             fc1, fc2, n_agents, n_actions,
                                             chkpt_dir=chkpt_dir,
-                                            name=self.agent_name+'_target_critic')
+                                            name=self.agent_name+'_target_critic',
+                                            encoder=encoders.get('target_critic'))
+
+        self.params = list(self.actor.parameters()) + list(self.critic.parameters())
+        self.target_params = list(self.target_actor.parameters()) + \
+                             list(self.target_critic.parameters())
 
         self.update_network_parameters(tau=1)
 
-    def choose_action(self, observation):
+    def choose_action(self, observation, mask=None):
+        # mask: (n_actions,) bool, False인 action은 고르지 않음
         state = T.tensor([observation], dtype=T.float).to(self.actor.device)
-        actions = self.actor.forward(state)
+        if mask is not None:
+            mask = T.as_tensor(mask, dtype=T.bool)[None].to(self.actor.device)
+        actions = self.actor.forward(state, mask)
         noise = T.rand(self.n_actions).to(self.actor.device)
         action = actions + noise
+        if mask is not None:
+            action = action * mask
 
         return action.detach().cpu().numpy()[0]
 
@@ -36,27 +66,99 @@ class Agent:
         if tau is None:
             tau = self.tau
 
-        target_actor_params = self.target_actor.named_parameters()
-        actor_params = self.actor.named_parameters()
+        soft_update(self.target_params, self.params, tau)
+
+    def save_models(self):
+        self.actor.save_checkpoint()
+        self.target_actor.save_checkpoint()
+        self.critic.save_checkpoint()
+        self.target_critic.save_checkpoint()
+
+    def load_models(self):
+        self.actor.load_checkpoint()
+        self.target_actor.load_checkpoint()
+        self.critic.load_checkpoint()
+        self.target_critic.load_checkpoint()
+
+
+class AgentEnsemble:
+    """All agents' networks stacked role by role (see ActorEnsemble/CriticEnsemble).
+
+    The per-agent networks stay the checkpoint format: store_to_agents copies the
+    stacked weights back into them before saving, load_from_agents re-stacks them.
+    """
+    def __init__(self, agents):
+        self.agents = agents
+        self.gamma = agents[0].gamma
+        self.tau = agents[0].tau
+        self.n_actions = agents[0].n_actions
+
+        alpha = agents[0].actor.optimizer.param_groups[0]['lr']
+        beta = agents[0].critic.optimizer.param_groups[0]['lr']
+        self.actor = ActorEnsemble(alpha, [agent.actor for agent in agents])
+        self.critic = CriticEnsemble(beta, [agent.critic for agent in agents])
+        self.target_actor = ActorEnsemble(alpha, [agent.target_actor for agent in agents])
+        self.target_critic = CriticEnsemble(beta, [agent.target_critic for agent in agents])
+
+        self.params = list(self.actor.parameters()) + list(self.critic.parameters())
+        self.target_params = list(self.target_actor.parameters()) + \
+                             list(self.target_critic.parameters())
+
+    def update_network_parameters(self, tau=None):
+        if tau is None:
+            tau = self.tau
+
+        soft_update(self.target_params, self.params, tau)
+
+    def load_from_agents(self):
+        for network in (self.actor, self.critic, self.target_actor, self.target_critic):
+            network.load_members()
+
+    def store_to_agents(self):
+        for network in (self.actor, self.critic, self.target_actor, self.target_critic):
+            network.store_members()
 
-        target_actor_state_dict = dict(target_actor_params)
-        actor_state_dict = dict(actor_params)
-        for name in actor_state_dict:
-            actor_state_dict[name] = tau*actor_state_dict[name].clone() + \
-                    (1-tau)*target_actor_state_dict[name].clone()
 
-        self.target_actor.load_state_dict(actor_state_dict)
+class SharedAgent:
+    """One actor, one critic and one target pair for the whole team (parameter
+    sharing), conditioned on a one-hot agent id.
 
-        target_critic_params = self.target_critic.named_parameters()
-        critic_params = self.critic.named_parameters()
+    Exposes the same actor/critic interface as AgentEnsemble, so MADDPG.learn
+    trains it like the ensemble: every agent's samples go through the one
+    network as a single n_agents times larger batch.
+    """
+    def __init__(self, actor_dims, critic_dims, n_actions, n_agents, chkpt_dir,
+                    alpha=0.01, beta=0.01, fc1=64,
+                    fc2=64, gamma=0.95, tau=0.01, encoders=None):
+        encoders = encoders or {}
+        self.gamma = gamma
+        self.tau = tau
+        self.n_actions = n_actions
+        self.agent_name = 'shared'
+        self.actor = SharedActorNetwork(alpha, actor_dims, fc1, fc2, n_actions, n_agents,
+                                        chkpt_dir=chkpt_dir, name='shared_actor',
+                                        encoder=encoders.get('actor'))
+        self.critic = SharedCriticNetwork(beta, critic_dims, fc1, fc2, n_agents, n_actions,
+                                          chkpt_dir=chkpt_dir, name='shared_critic',
+                                          encoder=encoders.get('critic'))
+        self.target_actor = SharedActorNetwork(alpha, actor_dims, fc1, fc2, n_actions, n_agents,
+                                               chkpt_dir=chkpt_dir, name='shared_target_actor',
+                                               encoder=encoders.get('target_actor'))
+        self.target_critic = SharedCriticNetwork(beta, critic_dims, fc1, fc2, n_agents, n_actions,
+                                                 chkpt_dir=chkpt_dir, name='shared_target_critic',
+                                                 encoder=encoders.get('target_critic'))
 
-        target_critic_state_dict = dict(target_critic_params)
-        critic_state_dict = dict(critic_params)
-        for name in critic_state_dict:
-            critic_state_dict[name] = tau*critic_state_dict[name].clone() + \
-                    (1-tau)*target_critic_state_dict[name].clone()
+        self.params = list(self.actor.parameters()) + list(self.critic.parameters())
+        self.target_params = list(self.target_actor.parameters()) + \
+                             list(self.target_critic.parameters())
+
+        self.update_network_parameters(tau=1)
+
+    def update_network_parameters(self, tau=None):
+        if tau is None:
+            tau = self.tau
 
-        self.target_critic.load_state_dict(critic_state_dict)
+        soft_update(self.target_params, self.params, tau)
 
     def save_models(self):
         self.actor.save_checkpoint()
@@ -0,0 +1,158 @@
+"""CPU timing and eager-mode tolerance checks for MADDPG(accelerate=..., bf16=...).
+
+    python -m benchmarks.accelerate
+    python -m benchmarks.accelerate --agents 3 --batch-size 1024 --no-compile
+    python -m benchmarks.accelerate --modes per_agent
+
+For every variant the actor/critic outputs (max abs difference) and the
+gradients of a critic and an actor loss (relative L2 difference), from the same
+weights on the same batch, are compared with eager float32, and MADDPG.learn is
+timed, for the per-agent learner and the stacked ensemble (--modes). The exit
+code is 1 if any variant is outside its tolerances or fails to learn.
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch as T
+
+from buffer import CompactMultiAgentReplayBuffer
+from maddpg import MADDPG
+
+# (accelerate, bf16) -> (max abs difference of the actor/critic outputs,
+#                       relative L2 difference of the gradients) against eager float32
+VARIANTS = {
+    ('script', False): (1e-5, 1e-3),
+    ('compile', False): (1e-5, 1e-3),
+    (None, True): (5e-2, 5e-2),
+    ('script', True): (5e-2, 5e-2),
+    ('compile', True): (5e-2, 5e-2),
+}
+
+
+def make_maddpg(n_agents, obs_dim, n_actions, mode, accelerate=None, bf16=False):
+    T.manual_seed(0)
+    return MADDPG([obs_dim]*n_agents, obs_dim*n_agents, n_agents, n_actions,
+                  chkpt_dir=tempfile.mkdtemp() + '/', ensemble=mode == 'ensemble',
+                  shared=mode == 'shared', accelerate=accelerate, bf16=bf16)
+
+
+def make_memory(n_agents, obs_dim, n_actions, batch_size):
+    np.random.seed(0)
+    memory = CompactMultiAgentReplayBuffer(2*batch_size, obs_dim*n_agents, [obs_dim]*n_agents,
+                                           n_actions, n_agents, batch_size)
+    for _ in range(2*batch_size):
+        obs = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+        obs_ = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+        memory.store_transition(obs, obs.reshape(-1), np.random.rand(n_agents, n_actions),
+                                -np.ones(n_agents), obs_, obs_.reshape(-1), [False]*n_agents)
+    return memory
+
+
+def outputs(maddpg, memory):
+    # actor/critic outputs and the gradients of a critic and an actor loss on a fixed batch
+    batch_size = memory.batch_size
+    states = T.as_tensor(memory.decode(memory.memory['state'][:batch_size]))
+    actions = T.as_tensor(np.ascontiguousarray(memory.memory['action'][:batch_size]))
+    actions = actions.reshape(batch_size, -1).expand(maddpg.n_agents, -1, -1)
+    actor_states = states.view(batch_size, maddpg.n_agents, -1).transpose(0, 1)
+
+    if maddpg.ensemble is None:
+        # per-agent networks, one forward per agent like MADDPG.learn
+        critics = [agent.critic for agent in maddpg.agents]
+        actors = [agent.actor for agent in maddpg.agents]
+        pi = T.stack([maddpg.forward(actor, actor_states[i]) for i, actor in enumerate(actors)])
+        critic = lambda action: T.stack([maddpg.forward(net, states, action[i]) for i, net in enumerate(critics)])
+    else:
+        critics, actors = [maddpg.ensemble.critic], [maddpg.ensemble.actor]
+        pi = maddpg.forward(actors[0], actor_states)
+        critic = lambda action: maddpg.forward(critics[0], states, action)
+
+    q = critic(actions)
+    critic_grads = T.autograd.grad(q.pow(2).mean(), [p for net in critics for p in net.parameters()])
+    mu = pi.transpose(0, 1).reshape(batch_size, -1).expand(maddpg.n_agents, -1, -1)
+    actor_grads = T.autograd.grad(critic(mu).mean(), [p for net in actors for p in net.parameters()])
+    grads = T.cat([g.reshape(-1) for g in critic_grads + actor_grads])
+    return pi.detach(), q.detach(), grads
+
+
+def differences(result, reference):
+    (pi, q, grads), (pi_ref, q_ref, grads_ref) = result, reference
+    return (float((pi - pi_ref).abs().max()), float((q - q_ref).abs().max()),
+            float((grads - grads_ref).norm() / grads_ref.norm()))
+
+
+def measure(fn, number):
+    fn()
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='accelerated vs eager MADDPG on CPU')
+    parser.add_argument('--agents', type=int, default=3)
+    parser.add_argument('--obs-dim', type=int, default=309)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--modes', default='per_agent,ensemble',
+                        help='comma separated subset of: per_agent,ensemble,shared')
+    parser.add_argument('--number', type=int, default=10, help='learn steps per timing')
+    parser.add_argument('--no-compile', action='store_true', help='skip the torch.compile variants')
+    return parser.parse_args()
+
+
+def check_mode(args, mode, memory, obs, n_actions):
+    """Prints every variant of one MADDPG mode, returns False if one is outside
+    its tolerances (or learn raises)."""
+    eager = make_maddpg(args.agents, args.obs_dim, n_actions, mode)
+    reference = outputs(eager, memory)
+    print('{:<28} choose_action {:>8.1f} us, learn {:>8.2f} ms'.format(
+        mode + ' eager', measure(lambda: eager.choose_action(obs), 200) * 1e6,
+        measure(lambda: eager.learn(memory), args.number) * 1e3))
+
+    ok = True
+    for (accelerate, bf16), (output_tol, grad_tol) in VARIANTS.items():
+        name = '{} {}{}'.format(mode, accelerate or 'eager', '+bf16' if bf16 else '')
+        if accelerate == 'compile' and (args.no_compile or not hasattr(T, 'compile')):
+            print('{:<28} skipped'.format(name))
+            continue
+        if bf16 and not hasattr(T, 'autocast'):
+            print('{:<28} skipped (no CPU autocast)'.format(name))
+            continue
+
+        maddpg = make_maddpg(args.agents, args.obs_dim, n_actions, mode, accelerate, bf16)
+        try:
+            pi_diff, q_diff, grad_diff = differences(outputs(maddpg, memory), reference)
+            learn_time = measure(lambda: maddpg.learn(memory), args.number)
+        except RuntimeError as e:
+            ok = False
+            print('{:<28} FAILED: {}'.format(name, str(e).strip().splitlines()[-1]))
+            continue
+        passed = max(pi_diff, q_diff) <= output_tol and grad_diff <= grad_tol
+        ok &= passed
+        print('{:<28} choose_action {:>8.1f} us, learn {:>8.2f} ms, pi {:.1e} q {:.1e} (tol {:.0e}), '
+              'grad {:.1e} (tol {:.0e}) {}'.format(
+                  name, measure(lambda: maddpg.choose_action(obs), 200) * 1e6, learn_time * 1e3,
+                  pi_diff, q_diff, output_tol, grad_diff, grad_tol, 'ok' if passed else 'FAILED'))
+    return ok
+
+
+def main():
+    args = parse_args()
+    n_actions = 5
+    memory = make_memory(args.agents, args.obs_dim, n_actions, args.batch_size)
+    obs = (np.random.rand(args.agents, args.obs_dim) < 0.5).astype(np.float32)
+
+    failed = False
+    for mode in args.modes.split(','):
+        failed |= not check_mode(args, mode, memory, obs, n_actions)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""CollisionEngine vs the former pairwise resolver of MAACEnv.step on random
+instances: results must match exactly, and the time per step is reported.
+
+    python -m benchmarks.collisions
+    python -m benchmarks.collisions --agents 10,100,1000 --instances 200
+
+Instances are crowded maps (a quarter of the free cells hold agents) with
+random obstacles and moves, so chains, swaps and same-cell collisions all
+show up. The exit code is 1 on any mismatch.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from collision import CollisionEngine
+from tests.collision_reference import instance, reference
+
+
+def measure(fn, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CollisionEngine vs pairwise resolver')
+    parser.add_argument('--agents', default='3,10,100,1000', help='comma separated agent counts')
+    parser.add_argument('--instances', type=int, default=100, help='random instances per agent count')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    failed = False
+    for n_agents in map(int, args.agents.split(',')):
+        size = max(5, int(np.ceil(np.sqrt(n_agents * 4 / 0.9))))
+        engine = CollisionEngine(size * size)
+        mismatches = 0
+        engine_time = reference_time = 0.0
+        for _ in range(args.instances):
+            pos, new_pos, blocked = instance(n_agents, size, rng)
+
+            start = time.perf_counter()
+            resolved, collided = engine.resolve(pos, new_pos, blocked)
+            engine_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            expected, expected_collided = reference(pos.tolist(), new_pos.tolist(), blocked.tolist())
+            reference_time += time.perf_counter() - start
+
+            if resolved.tolist() != expected or np.flatnonzero(collided).tolist() != expected_collided:
+                mismatches += 1
+        failed |= mismatches > 0
+        print('{:>5} agents on {}x{}: engine {:>9.1f} us, pairwise {:>11.1f} us, {} mismatches in {} instances'.format(
+            n_agents, size, size, engine_time / args.instances * 1e6,
+            reference_time / args.instances * 1e6, mismatches, args.instances))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
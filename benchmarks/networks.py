@@ -0,0 +1,98 @@
+"""Parameter count, FLOPs and learn step time of the MLP networks vs the shared
+CNN encoder (MADDPG network='cnn') on dense observations.
+
+    python -m benchmarks.networks
+    python -m benchmarks.networks --sizes 10,50 --agents 3
+
+FLOPs are multiply-adds of Linear/Conv2d layers for one sample, counted with
+forward hooks; 'team params' counts the shared encoders once.
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import torch as T
+import torch.nn as nn
+
+from buffer import CompactMultiAgentReplayBuffer
+from maddpg import MADDPG
+
+
+def count_macs(module, *inputs):
+    macs = [0]
+
+    def hook(layer, args, output):
+        if isinstance(layer, nn.Linear):
+            macs[0] += layer.in_features * layer.out_features
+        elif isinstance(layer, nn.Conv2d):
+            kernel = layer.in_channels // layer.groups * layer.kernel_size[0] * layer.kernel_size[1]
+            macs[0] += output.numel() * kernel
+
+    handles = [layer.register_forward_hook(hook) for layer in module.modules()
+               if isinstance(layer, (nn.Linear, nn.Conv2d))]
+    with T.no_grad():
+        module(*inputs)
+    for handle in handles:
+        handle.remove()
+    return macs[0]
+
+
+def n_params(parameters):
+    return sum(p.numel() for p in {id(p): p for p in parameters}.values())
+
+
+def measure(fn, number=5):
+    fn()
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def report(size, n_agents, network, batch_size=256, n_actions=5, visual_field=3):
+    obs_dim = visual_field**2 + 3*size*size
+    actor_dims = [obs_dim] * n_agents
+    maddpg = MADDPG(actor_dims, obs_dim*n_agents, n_agents, n_actions, chkpt_dir=tempfile.mkdtemp() + '/',
+                    ensemble=True, network=network, grid=(size, size, visual_field))
+    agent = maddpg.agents[0]
+    device = agent.actor.device
+
+    obs = (T.rand(1, obs_dim) < 0.5).float().to(device)
+    state = (T.rand(1, obs_dim*n_agents) < 0.5).float().to(device)
+    actions = T.rand(1, n_agents*n_actions).to(device)
+
+    memory = CompactMultiAgentReplayBuffer(2*batch_size, obs_dim*n_agents, actor_dims,
+                                           n_actions, n_agents, batch_size)
+    for _ in range(2*batch_size):
+        memory.store_transition(None, np.random.rand(obs_dim*n_agents) < 0.5, np.random.rand(n_agents, n_actions),
+                                -np.ones(n_agents), None, np.random.rand(obs_dim*n_agents) < 0.5,
+                                [False]*n_agents)
+
+    return {
+        'actor params': n_params(agent.actor.parameters()),
+        'critic params': n_params(agent.critic.parameters()),
+        'team params': n_params(maddpg.params),
+        'actor MFLOPs': count_macs(agent.actor, obs) / 1e6,
+        'critic MFLOPs': count_macs(agent.critic, state, actions) / 1e6,
+        'learn ms': measure(lambda: maddpg.learn(memory)) * 1e3,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='MLP vs CNN encoder size and cost')
+    parser.add_argument('--sizes', default='10,50', help='comma separated map sizes (n_row = n_col)')
+    parser.add_argument('--agents', type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    T.manual_seed(0)
+    np.random.seed(0)
+    for size in map(int, args.sizes.split(',')):
+        for network in ('mlp', 'cnn'):
+            result = report(size, args.agents, network)
+            print('{0}x{0}, {1} agents, {2}: '.format(size, args.agents, network) +
+                  ', '.join('{} {:,.2f}'.format(name, value) if isinstance(value, float) else
+                            '{} {:,}'.format(name, value) for name, value in result.items()))
@@ -0,0 +1,65 @@
+"""MADDPG.learn step latency with and without BatchPrefetcher.
+
+    python -m benchmarks.prefetch
+"""
+import tempfile
+import time
+
+import numpy as np
+
+from buffer import CompactMultiAgentReplayBuffer, MultiAgentReplayBuffer
+from maddpg import MADDPG
+from prefetch import BatchPrefetcher, sample_tensors
+
+
+def fill(memory, n_steps, n_agents, obs_dim, n_actions):
+    for _ in range(n_steps):
+        obs = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+        obs_ = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+        memory.store_transition(obs, obs.reshape(-1), list(np.random.rand(n_agents, n_actions)),
+                                -np.ones(n_agents), obs_, obs_.reshape(-1), [False]*n_agents)
+
+
+def learn_latency(maddpg, memory, repeat, gap):
+    maddpg.learn(memory)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        maddpg.learn(memory)
+        times.append(time.perf_counter() - start)
+        # stands in for the env steps that happen between two learn calls in Main.run
+        time.sleep(gap)
+    return np.median(times) * 1e3
+
+
+def run(n_agents=10, obs_dim=309, n_actions=5, batch_size=1024, fill_size=20000, repeat=20, gap=0.1):
+    actor_dims = [obs_dim] * n_agents
+    maddpg = MADDPG(actor_dims, obs_dim*n_agents, n_agents, n_actions,
+                    chkpt_dir=tempfile.mkdtemp() + '/', ensemble=True)
+    device = maddpg.agents[0].actor.device
+
+    results = []
+    for name, memory in (
+            ('dense', MultiAgentReplayBuffer(fill_size, obs_dim*n_agents, actor_dims,
+                                             n_actions, n_agents, batch_size)),
+            ('bits', CompactMultiAgentReplayBuffer(fill_size, obs_dim*n_agents, actor_dims,
+                                                   n_actions, n_agents, batch_size))):
+        fill(memory, fill_size, n_agents, obs_dim, n_actions)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            sample_tensors(memory, device)
+        sample = (time.perf_counter() - start) / repeat * 1e3
+        plain = learn_latency(maddpg, memory, repeat, gap)
+        prefetcher = BatchPrefetcher(memory, device)
+        prefetched = learn_latency(maddpg, prefetcher, repeat, gap)
+        prefetcher.close()
+        results.append({'n_agents': n_agents, 'buffer': name, 'sample_ms': sample,
+                        'plain_ms': plain, 'prefetched_ms': prefetched})
+    return results
+
+
+if __name__ == '__main__':
+    for n_agents in (3, 10):
+        for r in run(n_agents=n_agents):
+            print('{n_agents:>2} agents, {buffer:>5} buffer: sample {sample_ms:.1f} ms, '
+                  'learn {plain_ms:.1f} ms -> {prefetched_ms:.1f} ms with prefetcher'.format(**r))
@@ -0,0 +1,46 @@
+"""Env steps per second collected by ParallelRollout for a growing number of
+rollout workers (learning off, so this is the rollout side only).
+
+    python -m benchmarks.rollout
+"""
+import os
+import tempfile
+import time
+
+from buffer import CompactMultiAgentReplayBuffer
+from environment import MAACEnv
+from maddpg import MADDPG
+from rollout import ParallelRollout
+
+
+def throughput(env, n_workers, seconds=5.0):
+    actor_dims = [env.observation_space[i].shape[0] for i in range(env.n)]
+    maddpg = MADDPG(actor_dims, sum(actor_dims), env.n, env.action_space[0].n,
+                    chkpt_dir=tempfile.mkdtemp() + '/')
+    memory = CompactMultiAgentReplayBuffer(1000000, sum(actor_dims), actor_dims,
+                                           env.action_space[0].n, env.n, batch_size=1024)
+    rollout = ParallelRollout(env, maddpg, memory, n_workers=n_workers)
+    rollout.start()
+    try:
+        # wait until every worker is up before timing
+        while any(ring.write_cntr.value == 0 for ring in rollout.rings):
+            rollout.step(learn=False)
+            time.sleep(0.01)
+        rollout.step(learn=False)
+        steps = rollout.total_steps
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            rollout.step(learn=False)
+            time.sleep(0.001)
+        return (rollout.total_steps - steps) / (time.perf_counter() - start)
+    finally:
+        rollout.close()
+
+
+if __name__ == '__main__':
+    env = MAACEnv()
+    print('{} cpus'.format(os.cpu_count()))
+    for n_workers in (1, 2, 4, 8):
+        if n_workers > 2*os.cpu_count():
+            break
+        print('{} workers: {:.0f} env steps/s'.format(n_workers, throughput(env, n_workers)))
@@ -0,0 +1,63 @@
+"""Polyak soft update: per-agent load_state_dict blend vs in-place soft_update.
+
+    python -m benchmarks.soft_update
+"""
+import tempfile
+import time
+
+import torch as T
+
+from maddpg import MADDPG
+
+
+def legacy_update_network_parameters(agent, tau):
+    # Agent.update_network_parameters before soft_update was introduced
+    for network, target in ((agent.actor, agent.target_actor),
+                            (agent.critic, agent.target_critic)):
+        target_state_dict = dict(target.named_parameters())
+        state_dict = dict(network.named_parameters())
+        for name in state_dict:
+            state_dict[name] = tau*state_dict[name].clone() + \
+                    (1-tau)*target_state_dict[name].clone()
+        target.load_state_dict(state_dict)
+
+
+def timeit(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(agent_counts=(1, 2, 4, 8, 10, 16), obs_dim=309, n_actions=5, repeat=200):
+    results = []
+    for n_agents in agent_counts:
+        maddpg = MADDPG([obs_dim]*n_agents, obs_dim*n_agents, n_agents, n_actions,
+                        chkpt_dir=tempfile.mkdtemp() + '/')
+        tau = maddpg.agents[0].tau
+
+        def legacy():
+            for agent in maddpg.agents:
+                legacy_update_network_parameters(agent, tau)
+
+        def per_agent():
+            for agent in maddpg.agents:
+                agent.update_network_parameters()
+
+        results.append({
+            'n_agents': n_agents,
+            'legacy_ms': timeit(legacy, repeat) * 1e3,
+            'per_agent_ms': timeit(per_agent, repeat) * 1e3,
+            'batched_ms': timeit(maddpg.update_network_parameters, repeat) * 1e3,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    print('foreach lerp_:', hasattr(T, '_foreach_lerp_'))
+    print('{:>8} {:>11} {:>13} {:>11} {:>8}'.format(
+        'n_agents', 'legacy ms', 'per-agent ms', 'batched ms', 'speedup'))
+    for r in run():
+        print('{n_agents:>8} {legacy_ms:>11.3f} {per_agent_ms:>13.3f} {batched_ms:>11.3f}'.format(**r),
+              '{:>7.1f}x'.format(r['legacy_ms'] / r['batched_ms']))
@@ -0,0 +1,268 @@
+"""Benchmarks for the env, replay buffer and learner hot paths, with a saved
+baseline to flag regressions. CPU only is fine.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json   # exit code 1 on regressions
+    python -m benchmarks.suite --quick --only env,buffer
+
+Every result is the median time per call over `repeat` rounds. Cases that do
+not fit in --max-buffer-bytes, or that raise, are recorded as skipped/error.
+
+benchmarks/baseline.json is the committed --quick baseline (its "meta" block
+records the machine: a 1 CPU Linux box, CPU torch). Timings only compare on
+the same machine, so regenerate it with --quick --save-baseline before using
+--baseline elsewhere; a baseline from another machine or mode is warned about.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch as T
+
+from buffer import CompactMultiAgentReplayBuffer, MultiAgentReplayBuffer
+from environment import MAACEnv
+from maddpg import MADDPG
+
+FULL = {
+    'map_sizes': (10, 25, 50, 100),
+    'agent_counts': (1, 3, 10),
+    'buffer_fills': (1000, 10000, 100000, 1000000),
+    'learn_agent_counts': (1, 3, 10),
+    'batch_sizes': (256, 1024),
+}
+QUICK = {
+    'map_sizes': (10, 25),
+    'agent_counts': (1, 3),
+    'buffer_fills': (1000, 10000),
+    'learn_agent_counts': (3,),
+    'batch_sizes': (256,),
+}
+
+
+def measure(fn, number=100, repeat=5):
+    """Median seconds per call of fn over `repeat` rounds of `number` calls."""
+    fn()
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return float(np.median(rounds))
+
+
+def random_actions(n_agent, n=256):
+    return np.random.rand(n, n_agent, 5)
+
+
+def bench_env(config, results):
+    for size in config['map_sizes']:
+        for n_agent in config['agent_counts']:
+            for obs_mode in MAACEnv.OBS_MODES:
+                for grid in MAACEnv.GRIDS:
+                    params = 'n_row={0},n_col={0},n_agent={1}'.format(size, n_agent)
+                    if obs_mode != 'dense':
+                        params += ',obs_mode=' + obs_mode
+                    if grid != 'dense':
+                        params += ',grid=' + grid
+                    bench_env_case(MAACEnv(n_agent=n_agent, n_row=size, n_col=size, obs_mode=obs_mode, grid=grid),
+                                   params, results)
+
+
+def bench_env_case(env, params, results):
+    n_agent = env.n_agent
+    actions = random_actions(n_agent)
+    state = {'t': 0}
+
+    def step():
+        _, _, done, _ = env.step(actions[state['t'] % len(actions)])
+        state['t'] += 1
+        if any(done):
+            env.reset()
+
+    env.reset()
+    results['env.step/' + params] = measure(step, number=200)
+    results['env.reset/' + params] = measure(env.reset, number=20)
+    results['env.get_state/' + params] = measure(env.get_state, number=200)
+    snapshot = env.get_state()
+    results['env.set_state/' + params] = measure(lambda: env.set_state(snapshot), number=20)
+
+    def get_observation():
+        for i in range(n_agent):
+            env.get_observation(i)
+    results['env.get_observation/' + params] = measure(get_observation, number=200)
+
+
+def transition(n_agents, obs_dim, n_actions):
+    obs = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+    obs_ = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+    return (obs, obs.reshape(-1), np.random.rand(n_agents, n_actions), -np.ones(n_agents),
+            obs_, obs_.reshape(-1), [False]*n_agents)
+
+
+def bench_buffer(config, results, n_agents=3, obs_dim=309, n_actions=5, batch_size=256,
+                 max_bytes=2*1024**3):
+    critic_dims = n_agents * obs_dim
+    actor_dims = [obs_dim] * n_agents
+    samples = [transition(n_agents, obs_dim, n_actions) for _ in range(64)]
+
+    for name, cls in (('MultiAgentReplayBuffer', MultiAgentReplayBuffer),
+                      ('CompactMultiAgentReplayBuffer', CompactMultiAgentReplayBuffer)):
+        # size the buffer for the largest fill level that fits in max_bytes
+        probe = cls(1, critic_dims, actor_dims, n_actions, n_agents, batch_size)
+        fills = [fill for fill in config['buffer_fills'] if fill * probe.nbytes <= max_bytes]
+        for fill in config['buffer_fills']:
+            if fill not in fills:
+                results['{}.store_transition/fill={}'.format(name, fill)] = 'skipped'
+                results['{}.sample_buffer/fill={}'.format(name, fill)] = 'skipped'
+        if not fills:
+            continue
+
+        memory = cls(fills[-1], critic_dims, actor_dims, n_actions, n_agents, batch_size)
+        for fill in fills:
+            # fill up to this level, timing the stores on the way
+            n_store = fill - memory.mem_cntr
+            start = time.perf_counter()
+            for i in range(n_store):
+                memory.store_transition(*samples[i % len(samples)])
+            store = (time.perf_counter() - start) / max(n_store, 1)
+            results['{}.store_transition/fill={}'.format(name, fill)] = store
+
+            if fill >= batch_size:
+                results['{}.sample_buffer/fill={}'.format(name, fill)] = \
+                    measure(memory.sample_buffer, number=5)
+        del memory
+
+
+def bench_maddpg(config, results, obs_dim=309, n_actions=5):
+    for n_agents in config['learn_agent_counts']:
+        actor_dims = [obs_dim] * n_agents
+        for mode in ('per_agent', 'ensemble', 'shared'):
+            maddpg = MADDPG(actor_dims, obs_dim*n_agents, n_agents, n_actions,
+                            chkpt_dir=tempfile.mkdtemp() + '/', ensemble=mode == 'ensemble',
+                            shared=mode == 'shared')
+            obs = (np.random.rand(n_agents, obs_dim) < 0.5).astype(np.float32)
+            params = 'n_agents={},mode={}'.format(n_agents, mode)
+            results['MADDPG.choose_action/' + params] = measure(lambda: maddpg.choose_action(obs), number=200)
+
+            for batch_size in config['batch_sizes']:
+                key = 'MADDPG.learn/{},batch_size={}'.format(params, batch_size)
+                memory = CompactMultiAgentReplayBuffer(2*batch_size, obs_dim*n_agents, actor_dims,
+                                                       n_actions, n_agents, batch_size)
+                for _ in range(2*batch_size):
+                    memory.store_transition(*transition(n_agents, obs_dim, n_actions))
+                try:
+                    results[key] = measure(lambda: maddpg.learn(memory), number=3)
+                except RuntimeError as e:
+                    results[key] = 'error: {}'.format(str(e).splitlines()[0])
+
+
+BENCHMARKS = {
+    'env': bench_env,
+    'buffer': bench_buffer,
+    'maddpg': bench_maddpg,
+}
+
+
+def run(only=None, quick=False, max_buffer_bytes=2*1024**3):
+    np.random.seed(0)
+    T.manual_seed(0)
+    config = QUICK if quick else FULL
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if only is not None and name not in only:
+            continue
+        print('running', name, file=sys.stderr)
+        if bench is bench_buffer:
+            bench(config, results, max_bytes=max_buffer_bytes)
+        else:
+            bench(config, results)
+    return {
+        'meta': {
+            'time': time.time(),
+            'quick': quick,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'torch': T.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'cuda': T.cuda.is_available(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """[(name, baseline s, current s, ratio)] for every case slower than
+    baseline by more than threshold."""
+    regressions = []
+    for name, base in baseline['results'].items():
+        now = current['results'].get(name)
+        if not isinstance(base, float) or not isinstance(now, float):
+            continue
+        ratio = now / base
+        if ratio > 1 + threshold:
+            regressions.append((name, base, now, ratio))
+    return regressions
+
+
+def print_results(current, baseline=None):
+    for name, value in current['results'].items():
+        line = '{:<75} '.format(name)
+        line += '{:>12.1f} us'.format(value * 1e6) if isinstance(value, float) else value
+        base = baseline['results'].get(name) if baseline is not None else None
+        if isinstance(value, float) and isinstance(base, float):
+            line += '   x{:.2f} vs baseline'.format(value / base)
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='env/buffer/learner benchmarks')
+    parser.add_argument('--only', help='comma separated subset of: ' + ','.join(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='small sizes only')
+    parser.add_argument('--output', help='write results json here')
+    parser.add_argument('--baseline', help='compare against this results json')
+    parser.add_argument('--save-baseline', help='write results json here as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='flag cases slower than baseline by more than this fraction')
+    parser.add_argument('--max-buffer-bytes', type=float, default=2*1024**3)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    only = args.only.split(',') if args.only else None
+    current = run(only, args.quick, args.max_buffer_bytes)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ('quick', 'platform', 'processor', 'cpu_count', 'torch'):
+            if baseline['meta'].get(key) != current['meta'][key]:
+                print('warning: baseline {} is {!r}, this run {!r}'.format(
+                    key, baseline['meta'].get(key), current['meta'][key]), file=sys.stderr)
+    print_results(current, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(current, f, indent=1)
+
+    if baseline is not None:
+        regressions = compare(current, baseline, args.threshold)
+        for name, base, now, ratio in regressions:
+            print('REGRESSION {}: {:.1f} us -> {:.1f} us (x{:.2f})'.format(name, base*1e6, now*1e6, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import numpy as np
+
+# 0~255 각 byte의 1 bit 수
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class BitLayer:
+    """Binary (..., n_row, n_col) layer packed 8 cells per uint8 along the rows
+    (np.packbits, little bit order), 1/8 of a bool grid and 1/64 of float64.
+
+    Indexed like the float layers it replaces: layer[row, col] or
+    layer[env, rows, cols] reads 0/1 and `layer[...] = 0` / `= 1` sets cells,
+    also with index arrays that hit the same byte more than once. An index over
+    the leading axes only (layer[env_ids]) selects or assigns whole maps.
+    np.asarray(layer) unpacks to a uint8 grid.
+    """
+    def __init__(self, bits, n_col):
+        self.bits = bits
+        self.n_col = n_col
+
+    @classmethod
+    def zeros(cls, shape):
+        return cls(np.zeros(shape[:-1] + ((shape[-1] + 7) // 8,), dtype=np.uint8), shape[-1])
+
+    @classmethod
+    def from_array(cls, layer):
+        layer = np.asarray(layer)
+        return cls(np.packbits(layer != 0, axis=-1, bitorder='little'), layer.shape[-1])
+
+    @property
+    def shape(self):
+        return self.bits.shape[:-1] + (self.n_col,)
+
+    @property
+    def ndim(self):
+        return self.bits.ndim
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def __array__(self, dtype=None, copy=None):
+        layer = np.unpackbits(self.bits, axis=-1, count=self.n_col, bitorder='little')
+        return layer if dtype is None else layer.astype(dtype)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple) or len(index) < self.ndim:
+            return BitLayer(self.bits[index], self.n_col)
+        col = index[-1]
+        return (self.bits[index[:-1] + (col >> 3,)] >> (col & 7)) & 1
+
+    def __setitem__(self, index, value):
+        if not isinstance(index, tuple) or len(index) < self.ndim:
+            self.bits[index] = (value if isinstance(value, BitLayer) else BitLayer.from_array(value)).bits
+            return
+        col = index[-1]
+        index = index[:-1] + (col >> 3,)
+        if np.ndim(col) == 0:
+            mask = 1 << (col & 7)
+            if value:
+                self.bits[index] |= mask
+            else:
+                self.bits[index] &= ~mask & 0xFF
+            return
+        # 같은 byte의 다른 bit를 동시에 바꿀 수 있으므로 ufunc.at으로
+        mask = (1 << (np.asarray(col) & 7)).astype(np.uint8)
+        if value:
+            np.bitwise_or.at(self.bits, index, mask)
+        else:
+            np.bitwise_and.at(self.bits, index, ~mask)
+
+    def count(self, axis=None):
+        """Number of set cells, over every map or per leading index with axis
+        e.g. count(axis=(1, 2)) per env."""
+        return POPCOUNT[self.bits].sum(axis=axis)
+
+    def copy(self):
+        return BitLayer(self.bits.copy(), self.n_col)
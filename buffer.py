@@ -1,12 +1,77 @@
+import json
+import os
+
 import numpy as np
 
+
+def sample_indices(max_mem, batch_size, invalid=None):
+    # distinct indices in O(batch_size); np.random.choice(replace=False)
+    # permutes the whole range, which is O(max_mem). invalid: bool mask of
+    # indices never to draw
+    if 2 * batch_size > max_mem:
+        if invalid is None:
+            return np.random.choice(max_mem, batch_size, replace=False)
+        return np.random.choice(np.flatnonzero(~invalid[:max_mem]), batch_size, replace=False)
+    batch = np.empty(0, dtype=np.int64)
+    while len(batch) < batch_size:
+        extra = np.random.randint(max_mem, size=batch_size - len(batch))
+        if invalid is not None:
+            extra = extra[~invalid[extra]]
+        batch = np.unique(np.concatenate((batch, extra)))
+    return batch
+
+
+class SumTree:
+    """Array-backed binary tree whose inner nodes hold the sum of their children.
+
+    Leaf i holds the priority of buffer slot i. Updates and prefix-sum lookups
+    are O(log n) and vectorized over a whole batch.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.n_leaves = 1 << max(1, (capacity - 1).bit_length())
+        self.tree = np.zeros(2 * self.n_leaves)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.n_leaves]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.n_leaves
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while True:
+            self.tree[nodes] = self.tree[2*nodes] + self.tree[2*nodes+1]
+            if nodes[0] == 1:
+                return
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        # leaf index i such that sum(leaves[:i]) <= value < sum(leaves[:i+1])
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.n_leaves:
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return nodes - self.n_leaves
+
+
 class MultiAgentReplayBuffer:
+    prioritized = False
+    prefetched = False
+
     def __init__(self, max_size, critic_dims, actor_dims, 
             n_actions, n_agents, batch_size):
         self.mem_size = max_size
         self.mem_cntr = 0
         self.n_agents = n_agents
         self.actor_dims = actor_dims
+        self.critic_dims = critic_dims
         self.batch_size = batch_size
         self.n_actions = n_actions
 
@@ -17,6 +82,11 @@ class MultiAgentReplayBuffer:
 
         self.init_actor_memory()
 
+        self.nbytes = sum(memory.nbytes for memory in (
+            self.state_memory, self.new_state_memory, self.reward_memory, self.terminal_memory,
+            *self.actor_state_memory, *self.actor_new_state_memory, *self.actor_action_memory))
+        print('replay buffer: {} bytes'.format(self.nbytes))
+
     def init_actor_memory(self):
         self.actor_state_memory = []
         self.actor_new_state_memory = []
@@ -57,10 +127,26 @@ class MultiAgentReplayBuffer:
         self.terminal_memory[index] = done
         self.mem_cntr += 1
 
+    def store_transitions(self, states, actions, rewards, states_, dones):
+        # n개를 한번에: (n, critic_dims) states, (n, n_agents, n_actions) actions, actor 관측은 states에서 잘라냄
+        index = (self.mem_cntr + np.arange(len(states))) % self.mem_size
+        offsets = np.cumsum([0] + list(self.actor_dims))
+        for agent_idx in range(self.n_agents):
+            start, end = offsets[agent_idx], offsets[agent_idx+1]
+            self.actor_state_memory[agent_idx][index] = states[:, start:end]
+            self.actor_new_state_memory[agent_idx][index] = states_[:, start:end]
+            self.actor_action_memory[agent_idx][index] = actions[:, agent_idx]
+
+        self.state_memory[index] = states
+        self.new_state_memory[index] = states_
+        self.reward_memory[index] = rewards
+        self.terminal_memory[index] = dones
+        self.mem_cntr += len(states)
+
     def sample_buffer(self):
         max_mem = min(self.mem_cntr, self.mem_size)
 
-        batch = np.random.choice(max_mem, self.batch_size, replace=False)
+        batch = sample_indices(max_mem, self.batch_size)
 
         states = self.state_memory[batch]
         rewards = self.reward_memory[batch]
@@ -78,6 +164,319 @@ class MultiAgentReplayBuffer:
         return actor_states, states, actions, rewards, \
                actor_new_states, states_, terminal
 
+    def sample_into(self, out):
+        # see CompactMultiAgentReplayBuffer.sample_into; float64로 저장하므로 float32로 한 번 변환
+        batch = sample_indices(min(self.mem_cntr, self.mem_size), self.batch_size)
+        out['states'][...] = self.state_memory[batch]
+        out['states_'][...] = self.new_state_memory[batch]
+        out['rewards'][...] = self.reward_memory[batch]
+        np.take(self.terminal_memory, batch, axis=0, out=out['dones'])
+        for agent_idx in range(self.n_agents):
+            out['actions'][:, agent_idx] = self.actor_action_memory[agent_idx][batch]
+        return None
+
     def ready(self):
         if self.mem_cntr >= self.batch_size:
             return True
+
+
+class CompactMultiAgentReplayBuffer:
+    """Same interface as MultiAgentReplayBuffer, one contiguous record per step.
+
+    Each step stores the global state (every agent's observation concatenated)
+    once: the next state of a step is the state of the following slot. Where
+    the next state does not continue in the following slot (the end of an
+    episode), it is kept in an extra tail slot that is never sampled, so the
+    buffer holds about one observation per step plus one per episode. Actor
+    states are sliced out of the global states at sample time. mem_cntr counts
+    the transitions ever stored, n_transitions those still in the buffer and
+    slot_cntr the slots used including tails. obs_dtype:
+        'bits'    - observations are binary, bit-packed (critic_dims/8 bytes)
+        'uint8'   - small non-negative integers
+        'float32' - anything else
+    """
+    OBS_DTYPES = {'bits': np.uint8, 'uint8': np.uint8, 'float32': np.float32}
+    prioritized = False
+    prefetched = False
+
+    def __init__(self, max_size, critic_dims, actor_dims,
+            n_actions, n_agents, batch_size, obs_dtype='bits'):
+        if obs_dtype not in self.OBS_DTYPES:
+            raise ValueError('obs_dtype must be one of {}'.format(tuple(self.OBS_DTYPES)))
+        self.mem_size = max_size
+        self.mem_cntr = 0
+        self.slot_cntr = 0
+        self.n_transitions = 0
+        self.n_agents = n_agents
+        self.actor_dims = actor_dims
+        self.critic_dims = critic_dims
+        self.batch_size = batch_size
+        self.n_actions = n_actions
+        self.obs_dtype = obs_dtype
+
+        self.actor_offsets = np.cumsum([0] + list(actor_dims))
+        state_shape = ((critic_dims + 7) // 8,) if obs_dtype == 'bits' else (critic_dims,)
+        self.record_dtype = np.dtype([
+            ('state', self.OBS_DTYPES[obs_dtype], state_shape),
+            ('action', np.float32, (n_agents, n_actions)),
+            ('reward', np.float32, (n_agents,)),
+            ('terminal', np.bool_, (n_agents,)),
+            ('tail', np.bool_), # 앞 slot의 다음 관측만 담은 slot, 샘플링하지 않음
+        ])
+        self.init_memory()
+
+        self.nbytes = self.memory.nbytes
+        print('replay buffer: {} bytes ({} bytes per step)'.format(
+            self.nbytes, self.record_dtype.itemsize))
+
+    def init_memory(self):
+        self.memory = np.zeros(self.mem_size, dtype=self.record_dtype)
+
+    def encode(self, state):
+        if self.obs_dtype == 'bits':
+            return np.packbits(np.asarray(state) != 0, axis=-1)
+        return np.asarray(state, dtype=self.OBS_DTYPES[self.obs_dtype])
+
+    def decode(self, states):
+        if self.obs_dtype == 'bits':
+            states = np.unpackbits(states, axis=1, count=self.critic_dims)
+        return states.astype(np.float32)
+
+    def decode_into(self, slots, out):
+        # slots의 state를 float32 out에 바로 풀어 씀, float32는 중간 배열 없이 take
+        if self.obs_dtype == 'float32':
+            np.take(self.memory['state'], slots, axis=0, out=out)
+        elif self.obs_dtype == 'bits':
+            out[...] = np.unpackbits(self.memory['state'][slots], axis=1, count=self.critic_dims)
+        else:
+            out[...] = self.memory['state'][slots]
+
+    def store_transition(self, raw_obs, state, action, reward,
+                               raw_obs_, state_, done):
+        slots = self.store_transitions(np.asarray(state)[None], np.asarray(action)[None],
+                                       np.asarray(reward)[None], np.asarray(state_)[None], np.asarray(done)[None])
+        return slots[0]
+
+    def store_transitions(self, states, actions, rewards, states_, dones):
+        """store_transition for n consecutive transitions at once: (n, critic_dims)
+        states and states_, (n, n_agents, n_actions) actions, (n, n_agents)
+        rewards and dones. Returns the slots of the transitions."""
+        # block 안의 slot이 ring에서 겹치지 않도록 나눠서
+        chunk = max(1, self.mem_size // 2 - 1)
+        slots = []
+        for i in range(0, len(states), chunk):
+            block_slots, tail = self.store_block(states[i:i+chunk], actions[i:i+chunk], rewards[i:i+chunk],
+                                                 states_[i:i+chunk], dones[i:i+chunk])
+            slots.append(block_slots[~tail])
+        return np.concatenate(slots)
+
+    def store_block(self, states, actions, rewards, states_, dones):
+        # slot_cntr 위치에는 직전 step이 다음 관측을 tail로 써 두었으므로, 첫 state가 그것과 같으면
+        # (에피소드가 이어지면) 그 slot부터 쓰고, 다르면 tail로 남기고 다음 slot부터.
+        # block 안에서도 다음 state가 이어지지 않는 곳 (에피소드 끝)과 마지막에만 tail slot을 둠
+        n = len(states)
+        states, states_ = self.encode(states), self.encode(states_)
+        breaks = np.ones(n, dtype=bool)
+        breaks[:-1] = (states[1:] != states_[:-1]).any(axis=1)
+
+        # 지금까지 쓴 slot 수 (직전 tail 포함), 덮어쓰는 slot 중 transition이었던 것을 빼기 위해
+        written = min(self.slot_cntr + 1, self.mem_size) if self.slot_cntr else 0
+        start = self.slot_cntr
+        if self.slot_cntr and not np.array_equal(self.memory[start % self.mem_size]['state'], states[0]):
+            start += 1
+        offsets = np.arange(n) + np.concatenate(([0], np.cumsum(breaks[:-1])))
+        slots = (start + np.arange(offsets[-1] + 2)) % self.mem_size
+        tail = np.ones(len(slots), dtype=bool)
+        tail[offsets] = False
+        self.n_transitions += n - int(np.count_nonzero((slots < written) & ~self.memory['tail'][slots]))
+
+        block = np.zeros(len(slots), dtype=self.record_dtype)
+        block['state'][offsets] = states
+        block['state'][offsets[breaks] + 1] = states_[breaks]
+        block['action'][offsets] = actions
+        block['reward'][offsets] = rewards
+        block['terminal'][offsets] = dones
+        block['tail'] = tail
+        self.memory[slots] = block
+
+        self.slot_cntr = start + len(slots) - 1
+        self.mem_cntr += n
+        return slots, tail
+
+    def sample_batch(self):
+        max_mem = min(self.slot_cntr, self.mem_size)
+        # tail slot은 transition이 아니므로 빼고 뽑음
+        return sample_indices(max_mem, self.batch_size, invalid=self.memory['tail'])
+
+    def sample_buffer(self):
+        return self.get_batch(self.sample_batch())
+
+    def sample_into(self, out):
+        """sample_buffer straight into preallocated arrays (see
+        prefetch.BatchPrefetcher): float32 out['states'], out['states_'],
+        out['actions'] (batch_size, n_agents, n_actions), out['rewards'], bool
+        out['dones'] and, for prioritized replay, out['weights']. Returns the
+        sampled slots for update_priorities, None for uniform replay."""
+        self.get_batch_into(self.sample_batch(), out)
+        return None
+
+    def get_batch_into(self, batch, out):
+        self.decode_into(batch, out['states'])
+        self.decode_into((batch + 1) % self.mem_size, out['states_'])
+        np.take(self.memory['action'], batch, axis=0, out=out['actions'])
+        np.take(self.memory['reward'], batch, axis=0, out=out['rewards'])
+        np.take(self.memory['terminal'], batch, axis=0, out=out['dones'])
+
+    def get_batch(self, batch):
+        records = self.memory[batch]
+
+        states = self.decode(records['state'])
+        states_ = self.decode(self.memory['state'][(batch + 1) % self.mem_size])
+        rewards = np.ascontiguousarray(records['reward'])
+        terminal = np.ascontiguousarray(records['terminal'])
+        all_actions = np.ascontiguousarray(records['action'])
+
+        actor_states = []
+        actor_new_states = []
+        actions = []
+        for agent_idx in range(self.n_agents):
+            start, end = self.actor_offsets[agent_idx], self.actor_offsets[agent_idx+1]
+            actor_states.append(states[:, start:end])
+            actor_new_states.append(states_[:, start:end])
+            actions.append(all_actions[:, agent_idx])
+
+        return actor_states, states, actions, rewards, \
+               actor_new_states, states_, terminal
+
+    def ready(self):
+        if self.mem_cntr >= self.batch_size:
+            return True
+
+
+class MemmapMultiAgentReplayBuffer(CompactMultiAgentReplayBuffer):
+    """CompactMultiAgentReplayBuffer whose records live in an np.memmap file.
+
+    buffer_dir holds memory.dat (the records) and buffer.json (the counters and the
+    record layout). With resume=True an existing buffer with the same layout is
+    reopened, so training continues with its experience; the buffer can also be
+    larger than RAM. Call save() to flush the records and persist the counters.
+    """
+    def __init__(self, max_size, critic_dims, actor_dims,
+            n_actions, n_agents, batch_size, buffer_dir, obs_dtype='bits', resume=True):
+        self.buffer_dir = buffer_dir
+        self.memory_file = os.path.join(buffer_dir, 'memory.dat')
+        self.meta_file = os.path.join(buffer_dir, 'buffer.json')
+        self.resume = resume
+        super(MemmapMultiAgentReplayBuffer, self).__init__(
+            max_size, critic_dims, actor_dims, n_actions, n_agents, batch_size, obs_dtype)
+
+    def init_memory(self):
+        os.makedirs(self.buffer_dir, exist_ok=True)
+
+        meta = self.load_meta() if self.resume else None
+        if meta is not None and meta['mem_size'] == self.mem_size \
+                and meta['record_dtype'] == str(self.record_dtype.descr) \
+                and os.path.exists(self.memory_file):
+            mode = 'r+'
+            self.mem_cntr = meta['mem_cntr']
+            self.slot_cntr = meta['slot_cntr']
+            self.n_transitions = meta['n_transitions']
+            print('resuming replay buffer with', min(self.mem_cntr, self.mem_size), 'transitions')
+        else:
+            mode = 'w+'
+
+        self.memory = np.memmap(self.memory_file, dtype=self.record_dtype,
+                                mode=mode, shape=(self.mem_size,))
+
+    def load_meta(self):
+        try:
+            with open(self.meta_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self):
+        self.memory.flush()
+        meta = {
+            'mem_cntr': self.mem_cntr,
+            'slot_cntr': self.slot_cntr,
+            'n_transitions': self.n_transitions,
+            'mem_size': self.mem_size,
+            'record_dtype': str(self.record_dtype.descr),
+        }
+        with open(self.meta_file + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(self.meta_file + '.tmp', self.meta_file)
+
+
+class PrioritizedMultiAgentReplayBuffer(CompactMultiAgentReplayBuffer):
+    """Prioritized experience replay (Schaul et al.) over the compact records.
+
+    A transition's priority is (|td_error| + epsilon)**alpha, where td_error is
+    the largest TD error among the agents' critics. New transitions get the
+    highest priority seen so far. sample_prioritized also returns the slots and
+    importance-sampling weights (normalized by the batch maximum), with beta
+    annealed towards 1 by beta_increment per sample.
+    """
+    prioritized = True
+
+    def __init__(self, max_size, critic_dims, actor_dims,
+            n_actions, n_agents, batch_size, obs_dtype='bits',
+            alpha=0.6, beta=0.4, beta_increment=1e-4, epsilon=1e-6):
+        super(PrioritizedMultiAgentReplayBuffer, self).__init__(
+            max_size, critic_dims, actor_dims, n_actions, n_agents, batch_size, obs_dtype)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.tree = SumTree(max_size)
+
+    def store_block(self, states, actions, rewards, states_, dones):
+        slots, tail = super(PrioritizedMultiAgentReplayBuffer, self).store_block(
+            states, actions, rewards, states_, dones)
+        # tail slot은 우선순위 0이라 샘플링되지 않음
+        self.tree.update(slots, np.where(tail, 0.0, self.max_priority ** self.alpha))
+        return slots, tail
+
+    def sample_prioritized(self):
+        batch, weights = self.sample_prioritized_batch()
+        return self.get_batch(batch), batch, weights
+
+    def sample_into(self, out):
+        batch, weights = self.sample_prioritized_batch()
+        out['weights'][...] = weights
+        self.get_batch_into(batch, out)
+        return batch
+
+    def sample_prioritized_batch(self):
+        # (slots, importance sampling weights)
+        max_mem = min(self.slot_cntr, self.mem_size)
+        total = self.tree.total
+
+        # one sample from each of batch_size equal slices of the total priority
+        values = (np.arange(self.batch_size) + np.random.rand(self.batch_size)) \
+                 * total / self.batch_size
+        batch = self.find(values, max_mem)
+        # 반올림 때문에 우선순위 0인 slot (tail, 아직 안 쓴 slot)에 떨어지면 다시 뽑음
+        zero = self.tree.get(batch) == 0
+        while zero.any():
+            batch[zero] = self.find(np.random.rand(zero.sum()) * total, max_mem)
+            zero = self.tree.get(batch) == 0
+
+        probs = self.tree.get(batch) / total
+        weights = (self.n_transitions * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return batch, weights.astype(np.float32)
+
+    def find(self, values, max_mem):
+        # total 이상으로 반올림된 값은 마지막 leaf 밖으로 나가지 않도록 total 바로 아래로
+        values = np.minimum(values, np.nextafter(self.tree.total, 0))
+        return np.minimum(self.tree.find(values), max_mem - 1)
+
+    def update_priorities(self, batch, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(batch, priorities ** self.alpha)
@@ -0,0 +1,108 @@
+import numpy as np
+
+# 이 수 이하의 에이전트는 resolve_pairs (list 쌍 비교)가 array 연산보다 빠름
+PAIRWISE_AGENTS = 32
+
+
+class CollisionEngine:
+    """Resolves one step of agent moves on flat cell indices in linear time.
+
+    An agent that is rewound (sent back to pos) by a wall/obstacle or by a
+    collision also rewinds every agent that was moving into its cell, and so on
+    along the chain. Two agents collide when they end up in the same cell or
+    swap cells. Results are the same as MAACEnv's former pairwise loops and
+    recursive rewind.
+
+    Conflicts are found through an occupancy array keyed by cell, so nothing is
+    compared pairwise. Cell indices may span several envs
+    (env * n_row * n_col + row * n_col + col); agents of different envs never
+    share a cell. For a few agents, resolve_pairs gives the same results on
+    Python lists without the array overhead (see PAIRWISE_AGENTS).
+    """
+    def __init__(self, n_cells):
+        # 셀 -> 에이전트 번호 (-1: 없음), resolve 안에서만 쓰고 다시 -1로 되돌림
+        self.cell = -np.ones(n_cells, dtype=np.int32)
+
+    def resolve(self, pos, new_pos, blocked):
+        """pos, new_pos: (n,) flat cell indices, with new_pos == pos for agents
+        blocked by a wall or obstacle. Returns (new_pos after every rewind,
+        collided), collided marking the agents that hit another agent."""
+        agents = np.arange(len(pos))
+        new_pos = self.rewind(pos, new_pos, blocked)
+
+        # 같은 칸으로 이동: 마지막으로 쓴 에이전트만 남으므로 남은 쪽도 충돌로 표시
+        cell = self.cell
+        cell[new_pos] = agents
+        winner = cell[new_pos]
+        cell[new_pos] = -1
+        collided = winner != agents
+        collided[winner[collided]] = True
+
+        # 자리 바꾸기: 이동하려는 칸에 있던 에이전트가 내 칸으로 이동
+        cell[pos] = agents
+        other = cell[new_pos]
+        cell[pos] = -1
+        swap = (new_pos != pos) & (other >= 0)
+        swap[swap] = new_pos[other[swap]] == pos[swap]
+        collided |= swap
+
+        return self.rewind(pos, new_pos, collided), collided
+
+    def rewind(self, pos, new_pos, rewound):
+        # rewound 에이전트를 pos로 되돌리고, 되돌아간 에이전트의 칸으로 이동하려던 에이전트도 연쇄적으로 되돌림.
+        # 이동하려는 칸에 있는 에이전트(blocker)는 최대 하나라서 blocker별 에이전트 목록을 한 번 만들고
+        # chain을 앞에서부터 따라가면 에이전트마다 한 번씩만 방문
+        if not rewound.any():
+            return new_pos
+        n = len(pos)
+        rewound = rewound.copy()
+        cell = self.cell
+        cell[pos] = np.arange(n)
+        blocker = cell[new_pos]
+        cell[pos] = -1
+        blocker[(new_pos == pos) | rewound] = -1 # 멈춰 있는 에이전트는 chain에 들어가지 않음
+
+        waiting = np.bincount(blocker[blocker >= 0], minlength=n)
+        order = np.argsort(blocker, kind='stable')[n - waiting.sum():]
+        starts = np.cumsum(waiting) - waiting
+
+        frontier = np.flatnonzero(rewound)
+        while frontier.size:
+            counts = waiting[frontier]
+            total = counts.sum()
+            if total == 0:
+                break
+            offsets = np.repeat(starts[frontier] - np.cumsum(counts) + counts, counts) + np.arange(total)
+            frontier = order[offsets]
+            rewound[frontier] = True
+
+        return np.where(rewound, pos, new_pos)
+
+    def resolve_pairs(self, pos, new_pos, blocked):
+        """resolve on Python lists by comparing every pair of agents, O(n^2)
+        but cheaper than the array passes up to about PAIRWISE_AGENTS agents.
+        Returns (new_pos, collided) as lists."""
+        n = len(pos)
+        new_pos = list(new_pos)
+        self.rewind_pairs(pos, new_pos, [i for i in range(n) if blocked[i]])
+
+        collided = [False] * n
+        for i in range(n):
+            for j in range(i + 1, n):
+                if new_pos[i] == new_pos[j] or (new_pos[i] == pos[j] and new_pos[j] == pos[i]):
+                    collided[i] = collided[j] = True
+
+        self.rewind_pairs(pos, new_pos, [i for i in range(n) if collided[i]])
+        return new_pos, collided
+
+    @staticmethod
+    def rewind_pairs(pos, new_pos, rewound):
+        # rewind와 같은 chain을 stack으로: 되돌아간 에이전트의 칸으로 이동하려던 에이전트를 차례로 되돌림
+        stack = list(rewound)
+        while stack:
+            k = stack.pop()
+            new_pos[k] = pos[k]
+            for j in range(len(pos)):
+                if new_pos[j] == pos[k] and new_pos[j] != pos[j]:
+                    new_pos[j] = pos[j]
+                    stack.append(j)
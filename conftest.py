@@ -0,0 +1 @@
+# 저장소 루트를 sys.path에 넣어서 tests/가 루트 모듈 (environment, collision, ...)을 import
@@ -1,21 +1,32 @@
 import numpy as np
 from gym.spaces import Discrete
+from bitboard import BitLayer
+from collision import CollisionEngine, PAIRWISE_AGENTS
+from observation import ObservationBuilder, CompactObservationBuilder
 
 class MAACEnv:
     ACTIONS = {0: (-1, 0), 1: (0, 1), 2: (1, 0), 3: (0, -1), 4: (0, 0)}
 
+    OBS_MODES = ('dense', 'compact')
+    GRIDS = ('dense', 'bits')
+
     def __init__(self, n_agent=3, n_row=10, n_col=10,
-                 agent_pos=None, dirty_pos=None, obstacle_pos=None):
+                 agent_pos=None, dirty_pos=None, obstacle_pos=None,
+                 obs_mode='dense', obs_window=5, dirt_map=8, max_agents=10, grid='dense'):
+        if obs_mode not in self.OBS_MODES:
+            raise ValueError('obs_mode must be one of {}'.format(self.OBS_MODES))
+        if grid not in self.GRIDS:
+            raise ValueError('grid must be one of {}'.format(self.GRIDS))
         self.n_row = max(5, n_row)
         self.n_col = max(5, n_col)
-        self.n_agent = max(min(n_agent, 10), 1)
+        # max_agents=None이면 에이전트 수 제한 없음
+        self.n_agent = max(n_agent if max_agents is None else min(n_agent, max_agents), 1)
 
         self.agent_pos = agent_pos
-        self.dirty_pos = dirty_pos
         self.obstacle_pos = obstacle_pos
         
         if obstacle_pos is None or dirty_pos is None or agent_pos is None:
-            indices = np.array([(i, j) for i in range(self.n_row) for j in range(self.n_col)])
+            indices = np.argwhere(np.ones((self.n_row, self.n_col), dtype=bool))
             
             if obstacle_pos is None:
                 picked = np.random.choice(len(indices), self.n_row * self.n_col // 10, replace=False)
@@ -23,50 +34,149 @@ class MAACEnv:
                 indices = np.delete(indices, picked, axis=0)
                 
             if dirty_pos is None:
-                self.dirty_pos = indices
+                dirty_pos = indices
             
             if agent_pos is None:
                 self.agent_pos = indices[np.random.choice(len(indices), self.n_agent, replace=False)]
 
         self.visual_field = 3
+        # 'dense': 맵 전체 layer (ObservationBuilder), 'compact': 좌표 + 주변 window + 축소된 dirt map
+        self.obs_mode = obs_mode
+        self.obs_window = obs_window
+        self.dirt_map = dirt_map
+        # 'dense': float64 layer, 'bits': obstacle/dirty는 BitLayer, agent/visited는 작은 int
+        self.grid = grid
         
+        # dirty_pos는 들고 있지 않고 initial_state의 dirty layer에서 다시 만듦 (dirty_pos 속성)
+        self._build(dirty_pos)
+        self.initial_state = self.get_state()
         self.reset()
-        self.dirty_layer[self.dirty_layer == self.obstacle_layer] = 0
+        clear_obstacle_dirt(self.dirty_layer, self.obstacle_layer)
+        self.n_dirty = count_cells(self.dirty_layer)
+        self._reset_observation()
         
         """Gym Env variable"""
         self.n = self.n_agent
-        self.observation_space = np.array([np.zeros((self.visual_field**2 + 3*self.n_row*self.n_col,)) for _ in range(self.n_agent)])
+        self.observation_space = np.array([np.zeros((self.observer.obs_dim,)) for _ in range(self.n_agent)])
         self.action_space = np.array([Discrete(5) for _ in range(self.n_agent)])
         
         """ GUI control """
         self.render_callback = None
 
+    @classmethod
+    def from_scenario(cls, scenario, **kwargs):
+        # scenario 파일(dict)로 환경 생성, 빠진 항목은 랜덤 (kwargs: obs_mode 등)
+        agent_pos = scenario.get('agents')
+        n_agent = len(agent_pos) if agent_pos is not None else scenario.get('n_agent', 3)
+        return cls(n_agent=n_agent, n_row=scenario.get('n_row', 10), n_col=scenario.get('n_col', 10),
+                   agent_pos=agent_pos, dirty_pos=scenario.get('dirty'),
+                   obstacle_pos=scenario.get('obstacles'), **kwargs)
+
+    def scenario(self):
+        # from_scenario로 같은 환경을 다시 만들 수 있는 json 호환 dict
+        return {
+            'n_row': self.n_row,
+            'n_col': self.n_col,
+            'agents': [[int(row), int(col)] for row, col in self.agent_pos],
+            'obstacles': [[int(row), int(col)] for row, col in self.obstacle_pos],
+            'dirty': [[int(row), int(col)] for row, col in self.dirty_pos],
+        }
+
+    @property
+    def dirty_pos(self):
+        # 처음 먼지 칸 (n, 2)
+        dirty_layer = self.initial_state['dirty_layer']
+        if self.grid == 'bits':
+            dirty_layer = BitLayer(dirty_layer, self.n_col)
+        return np.argwhere(np.asarray(dirty_layer))
+
     def reset(self):
+        # __init__에서 agent_pos, dirty_pos로 만든 처음 상태를 복사
+        return self.set_state(self.initial_state)
+
+    def _build(self, dirty_pos):
+        # layer는 self._state (state_dtype) 안의 view라서 get_state/set_state가 한 번의 복사
+        self._state = np.zeros((), dtype=self.state_dtype())
+        self._bind_layers()
+        self.agent_layer[...] = -1
+        self.visited_layer[...] = -1
+
         self.agents = {}
-        self.agent_layer = -np.ones((self.n_row, self.n_col))
-        self.dirty_layer = np.zeros((self.n_row, self.n_col))
-        self.visited_layer = -np.ones((self.n_row, self.n_col))
-        
         self.steps = 0
+        self.cleaned = []
 
         for i, pos in enumerate(self.agent_pos):
+            pos = (int(pos[0]), int(pos[1]))
             self.agents[i] = {'idx': i, 'home': pos, 'pos': pos}
             self.agent_layer[pos[0], pos[1]] = i
             self.visited_layer[pos[0], pos[1]] = i
 
-        for pos in self.dirty_pos:
-            self.dirty_layer[pos[0], pos[1]] = 1
+        dirty_pos = cell_array(dirty_pos)
+        self.dirty_layer[dirty_pos[:, 0], dirty_pos[:, 1]] = 1
+        self.n_dirty = count_cells(self.dirty_layer) # 남은 더러운 칸 수, done 판정용
 
         # 환경 처음 만들 때만 obstacle_layer 초기화
         if not hasattr(self, 'obstacle_layer'):
-            self.obstacle_layer = np.zeros((self.n_row, self.n_col))
-            for pos in self.obstacle_pos:
-                self.obstacle_layer[pos[0], pos[1]] = 1
-        
-        obs_n = []
-        for agent_idx in range(self.n_agent):
-            obs_n.append(self.get_observation(agent_idx))
-        return obs_n
+            obstacle_layer = np.zeros((self.n_row, self.n_col))
+            obstacle_pos = cell_array(self.obstacle_pos)
+            obstacle_layer[obstacle_pos[:, 0], obstacle_pos[:, 1]] = 1
+            self.obstacle_layer = BitLayer.from_array(obstacle_layer) if self.grid == 'bits' else obstacle_layer
+            self.observer = self.make_observer(obstacle_layer[None])
+            self.moves = move_table(obstacle_layer)
+            self.collisions = CollisionEngine(self.n_row * self.n_col)
+
+    def _bind_layers(self):
+        self.agent_layer = self._state['agent_layer']
+        self.visited_layer = self._state['visited_layer']
+        self.dirty_layer = self._state['dirty_layer']
+        if self.grid == 'bits':
+            self.dirty_layer = BitLayer(self.dirty_layer, self.n_col)
+
+    def __getstate__(self):
+        # pickle하면 view가 따로 복사되므로 layer는 빼고 _state에 다시 연결
+        state = self.__dict__.copy()
+        for name in ('agent_layer', 'visited_layer', 'dirty_layer'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind_layers()
+
+    def state_dtype(self):
+        # get_state() 배열의 구조 (obstacle, scenario처럼 episode 중에 안 바뀌는 것은 제외)
+        shape = (self.n_row, self.n_col)
+        agent_dtype = index_dtype(self.grid, self.n_agent)
+        if self.grid == 'bits':
+            dirty = ('dirty_layer', np.uint8, (self.n_row, (self.n_col + 7) // 8))
+        else:
+            dirty = ('dirty_layer', np.float64, shape)
+        return np.dtype([('agent_layer', agent_dtype, shape), ('visited_layer', agent_dtype, shape), dirty,
+                         ('pos', np.int64, (self.n_agent, 2)), ('steps', np.int64), ('n_dirty', np.int64)],
+                        align=True)
+
+    def get_state(self):
+        """Snapshot of the episode (layers, agent positions, step counter,
+        remaining dirt) as one contiguous array of state_dtype(). The env draws
+        no random numbers after __init__, so there is no RNG state to keep."""
+        self._state['pos'] = self._positions('new_pos')
+        self._state['steps'] = self.steps
+        self._state['n_dirty'] = self.n_dirty
+        return self._state.copy()
+
+    def set_state(self, state):
+        """Restores a get_state() snapshot with one copy and returns the
+        observations, like reset(). Agent dicts are rebuilt from the positions and
+        the observer is reset from the restored layers."""
+        if state.dtype != self._state.dtype:
+            raise ValueError('state does not match this env, see state_dtype()')
+        self._state[...] = state
+        self.agents = {i: {'idx': i, 'home': self.agents[i]['home'], 'pos': (row, col)}
+                       for i, (row, col) in enumerate(self._state['pos'].tolist())}
+        self.steps = int(self._state['steps'])
+        self.n_dirty = int(self._state['n_dirty'])
+        self.cleaned = []
+        return self._reset_observation()
 
     def step(self, actions):
         rewards = [0 for i in range(self.n_agent)]
@@ -75,112 +185,91 @@ class MAACEnv:
             self._step_agent(self.agents[i], action)
             rewards[i] -= 1 # 1-step 마다 reward -1
 
-        """ invalid action check"""
-        for i, a in self.agents.items():
-            if any((a['new_pos'] in self.obstacle_pos,
-                   a['new_pos'][0] < 0, a['new_pos'][0] >= self.n_row,
-                   a['new_pos'][1] < 0,a['new_pos'][1] >= self.n_col)):
-                self._rewind_agent(a)
-                rewards[i] -= 1 # 벽, 장애물과 충돌
-                     
-        collided = set()
+        """ invalid action, collision check"""
+        n_col = self.n_col
+        pos = [a['pos'][0]*n_col + a['pos'][1] for a in self.agents.values()]
+        new_pos = [a['new_pos'][0]*n_col + a['new_pos'][1] for a in self.agents.values()]
+        blocked = [a['blocked'] for a in self.agents.values()]
+        if self.n_agent <= PAIRWISE_AGENTS:
+            new_pos, collided = self.collisions.resolve_pairs(pos, new_pos, blocked)
+        else:
+            new_pos, collided = self.collisions.resolve(np.array(pos), np.array(new_pos), np.array(blocked))
         for i, a in self.agents.items():
-            for j, b in self.agents.items():
-                if i >= j:
-                    continue
-                if a['pos'] == b['new_pos'] and a['new_pos'] == b['pos']:
-                    collided.add(i)
-                    collided.add(j)
-                    continue
-                if a['new_pos'] == b['new_pos']:
-                    collided.add(i)
-                    collided.add(j)
-        for i in tuple(collided):
-            self._rewind_agent(self.agents[i])
-            rewards[i] -= 1 #충돌한 애들끼리 +1
+            a['new_pos'] = divmod(int(new_pos[i]), self.n_col)
+            rewards[i] -= int(blocked[i]) # 벽, 장애물과 충돌
+            rewards[i] -= int(collided[i]) # 에이전트끼리 충돌
         
+        cleaned = []
+        self.cleaned = [] # 이번 step에 청소된 (agent, row, col)
+        for agent in self.agents.values():
+            self.agent_layer[agent['pos']] = -1
         for i, agent in self.agents.items():
+            self.agent_layer[agent['new_pos']] = i
             self.visited_layer[agent['new_pos']] = i
             if self.dirty_layer[agent['new_pos']] == 1:
                 self.dirty_layer[agent['new_pos']] = 0 
+                self.n_dirty -= 1
                 rewards[i] +=1 # 청소 했으니까 +1
-                
-        
-        # TODO: evaluate reward, done, e.t.c.
-        observations = [self.get_observation(i) for i in range(self.n_agent)]
+                cleaned.append(agent['new_pos'][0]*self.n_col + agent['new_pos'][1])
+                self.cleaned.append((i,) + agent['new_pos'])
+
+        observations = self.observer.update(self._positions('pos')[None], self._positions('new_pos')[None],
+                                            np.zeros(len(cleaned)), cleaned)[0]
         done = [False for i in range(self.n_agent)]
         info = self.get_info()
         
-        if np.all(self.dirty_layer == 0):
+        if self.n_dirty == 0:
             done = [True for i in range(self.n_agent)]   # 전부 청소되면 done
         
-        # something to do before return goes here
         self.steps += 1
 
+        # 도착한 칸의 청소와 reward는 위에서 끝났으므로 기록만
         for i, agent in self.agents.items():
-            if self.dirty_layer[agent['new_pos']] == 1: # 도착한 곳이 더러운 곳이라면 reward +1
-                self.dirty_layer[agent['new_pos']] = 0 # 도착한 곳은 청소 됨
-                rewards[i] += 1
             agent['reward'] = rewards[i]
         
-        self.done = np.all(self.dirty_layer == 0)   # 전부 청소되면 done
+        self.done = self.n_dirty == 0   # 전부 청소되면 done
         
         return observations, rewards, done, info
 
     def _step_agent(self, agent, action):
         if 'new_pos' in agent:
             agent['pos'] = agent['new_pos']
-        agent['new_pos'] = (
-            agent['pos'][0] + MAACEnv.ACTIONS[action][0],
-            agent['pos'][1] + MAACEnv.ACTIONS[action][1]
-        )
+        # 벽, 장애물로 막힌 이동은 move_table의 action bit가 0
+        row, col = agent['pos']
+        agent['blocked'] = not (self.moves[row, col] >> action) & 1
+        agent['new_pos'] = agent['pos'] if agent['blocked'] else \
+            (row + MAACEnv.ACTIONS[action][0], col + MAACEnv.ACTIONS[action][1])
         agent['action'] = action
-        if 'new_pos' in agent:
-            self.agent_layer[agent['pos']] = -1
-            try:
-                self.agent_layer[agent['new_pos']] = agent['idx']
-            except IndexError:
-                self.agent_layer[agent['pos']] = agent['idx']
-                agent['new_pos'] = agent['pos']
-
-    def _rewind_agent(self, agent):
-        if self.agent_layer[agent['pos']] not in (-1, agent['idx']):
-            self._rewind_agent(self.agents[self.agent_layer[agent['pos']]])
-        self.agent_layer[agent['pos']] = agent['idx']
-        if 'new_pos' in agent:
-            self.agent_layer[agent['new_pos']] = -1
-            agent['new_pos'] = agent['pos']
+
+    def get_action_mask(self):
+        # (n_agent, 5) 벽, 장애물로 막히지 않은 action (다른 에이전트와의 충돌은 고려하지 않음)
+        positions = self._positions('new_pos')
+        return legal_actions(self.moves[positions[:, 0], positions[:, 1]])
+
+    def _positions(self, key):
+        return np.array([agent.get(key, agent['pos']) for agent in self.agents.values()])
+
+    # 현재 에이전트 위치 (n_agent, 2)
+    def get_positions(self):
+        return self._positions('new_pos')
+
+    def make_observer(self, obstacle_layer):
+        # obstacle_layer: (num_envs, n_row, n_col)
+        if self.obs_mode == 'compact':
+            return CompactObservationBuilder(obstacle_layer, self.n_agent, self.obs_window, self.dirt_map)
+        return ObservationBuilder(obstacle_layer, self.n_agent, self.visual_field)
+
+    def _reset_observation(self):
+        return self.observer.reset(self._positions('new_pos')[None], np.asarray(self.dirty_layer)[None])[0]
 
     # 특정 에이전트의 local observation 반환
+    # (ObservationBuilder 버퍼의 view, 다음 다음 step까지 유효)
     def get_observation(self, agent_idx):
-        pos = self.agents[agent_idx]['pos']
-        padded_pos = np.array([pos[0]+1, pos[1]+1])
-        
-        # 에이전트 주변 시야
-        padded_obstacle_layer = np.ones((self.n_row+2, self.n_col+2))
-        padded_obstacle_layer[1:-1, 1:-1] = self.obstacle_layer
-        vf=self.visual_field//2
-        agent_vision_obstacle = padded_obstacle_layer[padded_pos[0]-vf:padded_pos[0]+(vf+1), padded_pos[1]-vf:padded_pos[1]+(vf+1)]
-        agent_vision_obstacle = agent_vision_obstacle.reshape(self.visual_field**2)
-        
-        # 에이전트 자신
-        agent_self_layer = np.zeros((self.n_row, self.n_col))
-        agent_self_layer[pos[0], pos[1]] = 1
-        agent_self_layer = agent_self_layer.reshape(self.n_row*self.n_col)
-        
-        # 다른 에이전트
-        other_agent_layer = np.zeros_like(self.agent_layer)
-        other_agent_layer[np.argwhere(self.agent_layer != -1)] = 1
-        other_agent_layer[pos[0], pos[1]] = 0
-        other_agent_layer_flatten = other_agent_layer.reshape(self.n_row*self.n_col)
-        
-        # 청소해야할 곳
-        dirty_layer_flatten = self.dirty_layer.copy().reshape(self.n_row*self.n_col)
-        
-        return np.concatenate((agent_vision_obstacle, agent_self_layer, other_agent_layer_flatten, dirty_layer_flatten))
+        return self.observer.obs[0, agent_idx]
         
     def get_info(self):
         # we can use this to render GUI, do debug, and e.t.c. 
+        # (grid='bits'면 dirty_layer는 BitLayer, np.asarray로 풀어서 사용)
         info = {
             'steps': self.steps,
             'agents_info': self.agents,
@@ -193,4 +282,203 @@ class MAACEnv:
         self.render_callback(*args, **kwargs)
 
     def close(self):
-        pass
\ No newline at end of file
+        pass
+
+def move_table(obstacle_layer):
+    """(..., n_row, n_col) uint8 legal-move table of obstacle_layer (..., n_row, n_col):
+    bit `action` of a cell is set when that move stays on the map and off
+    obstacles. Built once per map, one byte per cell, so checking a move is one
+    lookup and legal_actions(table) is the action mask."""
+    n_row, n_col = obstacle_layer.shape[-2:]
+    table = np.zeros(obstacle_layer.shape, dtype=np.uint8)
+    for action, (dr, dc) in MAACEnv.ACTIONS.items():
+        rows = np.arange(n_row)[:, None] + dr
+        cols = np.arange(n_col)[None, :] + dc
+        inside = (rows >= 0) & (rows < n_row) & (cols >= 0) & (cols < n_col)
+        obstacle = obstacle_layer[..., np.clip(rows, 0, n_row-1), np.clip(cols, 0, n_col-1)] == 1
+        table |= ((inside & ~obstacle) << action).astype(np.uint8)
+    return table
+
+
+def legal_actions(moves):
+    # move_table 값 (...) -> (..., 5) bool
+    return (moves[..., None] >> np.arange(len(MAACEnv.ACTIONS), dtype=np.uint8)) & 1 == 1
+
+
+def cell_array(positions):
+    # [(row, col), ...] -> (n, 2) int array, 비어 있어도 (0, 2)
+    return np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+
+
+def index_dtype(grid, n_agent):
+    # agent_layer, visited_layer dtype: 'bits'면 에이전트 번호(-1 포함)가 들어가는 가장 작은 int
+    return np.min_scalar_type(-n_agent) if grid == 'bits' else np.dtype(np.float64)
+
+
+def make_layers(grid, shape, n_agent):
+    # (agent_layer, visited_layer, dirty_layer), 빈 칸은 -1 / 0
+    agent_dtype = index_dtype(grid, n_agent)
+    dirty_layer = BitLayer.zeros(shape) if grid == 'bits' else np.zeros(shape)
+    return np.full(shape, -1, dtype=agent_dtype), np.full(shape, -1, dtype=agent_dtype), dirty_layer
+
+
+def clear_obstacle_dirt(dirty_layer, obstacle_layer):
+    # 장애물 칸은 더럽지 않음
+    if isinstance(dirty_layer, BitLayer):
+        dirty_layer.bits &= ~obstacle_layer.bits
+    else:
+        dirty_layer[dirty_layer == obstacle_layer] = 0
+
+
+def count_cells(layer, axis=None):
+    # 1인 칸 수 (axis=(1, 2)면 env별)
+    if isinstance(layer, BitLayer):
+        return layer.count(axis)
+    return np.count_nonzero(layer, axis=axis)
+
+
+class BatchedMAACEnv:
+    """Steps `num_envs` independent MAACEnv worlds at once.
+
+    Every layer is kept as a (num_envs, n_row, n_col) array and each phase of
+    MAACEnv.step (move, wall/obstacle rewind, swap/same-cell collision, chained
+    rewind, cleaning) is computed as array ops over all envs and agents.
+    """
+    def __init__(self, num_envs=1, n_agent=3, n_row=10, n_col=10,
+                 agent_pos=None, dirty_pos=None, obstacle_pos=None, envs=None, max_agents=10, grid='dense'):
+        if envs is None:
+            envs = [MAACEnv(n_agent, n_row, n_col, agent_pos, dirty_pos, obstacle_pos,
+                            max_agents=max_agents, grid=grid)
+                    for _ in range(num_envs)]
+        if len({(env.n_agent, env.n_row, env.n_col, env.obs_mode, env.obs_window, env.dirt_map, env.grid)
+                for env in envs}) != 1:
+            raise ValueError('all envs must share n_agent, n_row, n_col, the observation mode and the grid')
+
+        self.num_envs = len(envs)
+        self.n_agent = envs[0].n_agent
+        self.n_row = envs[0].n_row
+        self.n_col = envs[0].n_col
+        self.visual_field = envs[0].visual_field
+        self.grid = envs[0].grid
+
+        shape = (self.num_envs, self.n_row, self.n_col)
+        self.home = np.array([[env.agents[i]['home'] for i in range(self.n_agent)]
+                              for env in envs], dtype=np.int64)
+        obstacle_layer = np.stack([np.asarray(env.obstacle_layer) for env in envs])
+        init_dirty_layer = np.zeros(shape)
+        for e, env in enumerate(envs):
+            dirty_pos = cell_array(env.dirty_pos)
+            init_dirty_layer[e, dirty_pos[:, 0], dirty_pos[:, 1]] = 1
+        if self.grid == 'bits':
+            obstacle_layer, self.obstacle_layer = obstacle_layer, BitLayer.from_array(obstacle_layer)
+            self.init_dirty_layer = BitLayer.from_array(init_dirty_layer)
+        else:
+            self.obstacle_layer = obstacle_layer
+            self.init_dirty_layer = init_dirty_layer
+        self.init_n_dirty = count_cells(self.init_dirty_layer, axis=(1, 2))
+
+        self.observer = envs[0].make_observer(obstacle_layer)
+        self.moves = move_table(obstacle_layer)
+        self._action_offset = np.array([dr * self.n_col + dc for dr, dc in
+                                        (MAACEnv.ACTIONS[a] for a in range(len(MAACEnv.ACTIONS)))])
+
+        self._env_idx = np.arange(self.num_envs)[:, None]
+        self._agent_idx = np.arange(self.n_agent)[None, :]
+        # 모든 env의 셀을 이어 붙인 번호로 한번에 충돌 처리
+        self._cell_offset = np.arange(self.num_envs)[:, None] * (self.n_row * self.n_col)
+        self.collisions = CollisionEngine(self.num_envs * self.n_row * self.n_col)
+
+        self.agent_layer, self.visited_layer, self.dirty_layer = make_layers(self.grid, shape, self.n_agent)
+        self.n_dirty = np.zeros(self.num_envs, dtype=np.int64) # env별 남은 더러운 칸 수
+        self.steps = np.zeros(self.num_envs, dtype=np.int64)
+        self.pos = self.home.copy()
+        self.new_pos = self.home.copy()
+
+        self.reset()
+        clear_obstacle_dirt(self.dirty_layer, self.obstacle_layer)
+        self.n_dirty[:] = count_cells(self.dirty_layer, axis=(1, 2))
+        self.observer.reset(self.new_pos, np.asarray(self.dirty_layer))
+
+        """Gym Env variable"""
+        self.n = self.n_agent
+        self.observation_space = envs[0].observation_space
+        self.action_space = envs[0].action_space
+
+    def reset(self, env_ids=None):
+        if env_ids is None:
+            env_ids = np.arange(self.num_envs)
+        env_ids = np.asarray(env_ids)
+
+        self.agent_layer[env_ids] = -1
+        self.visited_layer[env_ids] = -1
+        self.dirty_layer[env_ids] = self.init_dirty_layer[env_ids]
+        self.n_dirty[env_ids] = self.init_n_dirty[env_ids]
+        self.steps[env_ids] = 0
+        self.pos[env_ids] = self.home[env_ids]
+        self.new_pos[env_ids] = self.home[env_ids]
+
+        rows, cols = self.home[env_ids, :, 0], self.home[env_ids, :, 1]
+        self.agent_layer[env_ids[:, None], rows, cols] = self._agent_idx
+        self.visited_layer[env_ids[:, None], rows, cols] = self._agent_idx
+
+        return self.observer.reset(self.new_pos, np.asarray(self.dirty_layer), env_ids)
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        if actions.ndim == 3:
+            actions = np.argmax(actions, axis=-1)
+
+        self.pos = self.new_pos
+        legal = (self.moves[self._env_idx, self.pos[..., 0], self.pos[..., 1]] >> actions) & 1
+        rewards = -np.ones((self.num_envs, self.n_agent)) # 1-step 마다 reward -1
+
+        """ invalid action, collision check"""
+        invalid = legal == 0
+        rewards -= invalid # 벽, 장애물과 충돌
+        pos_idx = self._flat(self.pos) + self._cell_offset
+        new_idx = np.where(invalid, pos_idx, pos_idx + self._action_offset[actions])
+        new_idx, collided = self.collisions.resolve(pos_idx.ravel(), new_idx.ravel(), invalid.ravel())
+        rewards -= collided.reshape(invalid.shape) # 충돌
+        new_pos = np.stack(np.divmod(new_idx.reshape(invalid.shape) - self._cell_offset, self.n_col), axis=-1)
+        self.new_pos = new_pos
+
+        rows, cols = new_pos[..., 0], new_pos[..., 1]
+        self.agent_layer[self._env_idx, self.pos[..., 0], self.pos[..., 1]] = -1
+        self.agent_layer[self._env_idx, rows, cols] = self._agent_idx
+        self.visited_layer[self._env_idx, rows, cols] = self._agent_idx
+        cleaned = self.dirty_layer[self._env_idx, rows, cols] == 1
+        rewards += cleaned # 청소 했으니까 +1
+        self.dirty_layer[self._env_idx, rows, cols] = 0
+        self.n_dirty -= cleaned.sum(axis=1)
+
+        cleaned_env, cleaned_agent = np.nonzero(cleaned)
+        observations = self.observer.update(self.pos, new_pos, cleaned_env,
+                                            self._flat(new_pos[cleaned_env, cleaned_agent]))
+        info = self.get_info()
+        self.done = self.n_dirty == 0
+        done = np.repeat(self.done[:, None], self.n_agent, axis=1)
+        self.steps += 1
+
+        return observations, rewards, done, info
+
+    def _flat(self, pos):
+        return pos[..., 0] * self.n_col + pos[..., 1]
+
+    def get_observations(self):
+        return self.observer.obs
+
+    def get_action_mask(self):
+        # (num_envs, n_agent, 5), MAACEnv.get_action_mask
+        return legal_actions(self.moves[self._env_idx, self.new_pos[..., 0], self.new_pos[..., 1]])
+
+    def get_info(self):
+        info = {
+            'steps': self.steps.copy(),
+            'agent_pos': self.new_pos,
+            'visited_layer': self.visited_layer,
+            'dirty_layer': self.dirty_layer,
+        }
+        return info
+
+    def close(self):
+        pass
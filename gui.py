@@ -1,14 +1,16 @@
 from threading import Thread
-from tkinter import Frame, Canvas, N, S, E, W, Menu, X, Label, W
+from tkinter import Frame, Canvas, N, S, E, W, Menu, X, Label, W, Button, Scale, HORIZONTAL
 from tkinter import ttk
-from tkinter.simpledialog import askinteger
+from tkinter.filedialog import askdirectory
+from tkinter.simpledialog import askinteger, askstring
 
 import random
 
-import numpy as np
-
 from colors import AGENT_COLORS
 from environment import MAACEnv
+from render import FrameStream, merge_frames
+from trajectory import TrajectoryReader
+import live
 
 class GUI(Frame):
     OBSTACLE = 0
@@ -24,6 +26,7 @@ class GUI(Frame):
     }
     
     CELL_SIZE = 50
+    FRAME_INTERVAL = 100 # ms, 학습 화면 갱신 주기
     
     def __init__(self, root, main, row_num=10, col_num=10):
         Frame.__init__(self, root)
@@ -33,6 +36,9 @@ class GUI(Frame):
         self.main = main
         self.running_thread = None
         self.exported_env = False
+        self.live_conn = None
+        self.polling = False
+        self.trajectories = None
         
         self.grid(row=0,column=0)
         
@@ -148,6 +154,11 @@ class GUI(Frame):
         model_menu.add_separator()
         model_menu.add_command(label='학습 초기화',
                                command=self.reset_learn)
+        model_menu.add_separator()
+        model_menu.add_command(label='실행 중인 학습 보기',
+                               command=self.attach)
+        model_menu.add_command(label='기록된 학습 보기',
+                               command=self.open_trajectory)
         
         test_menu = Menu(menu, tearoff=0)
         menu.add_cascade(label='테스트', menu=test_menu)
@@ -345,12 +356,14 @@ class GUI(Frame):
         self.map_status.config(text='{}×{}'.format(self.n_row, self.n_col))
     
     def start_learn(self):
-        if self.running_thread is not None:
+        # 뷰어 (attach, open_trajectory)로 보는 중에는 학습하지 않음
+        if self.running_thread is not None or self.live_conn is not None or self.trajectories is not None:
             return
         
         self.set_gui_mode(GUI.FIXED)
         
         if not self.exported_env:
+            self.idx_to_agent = {}
             obstacle_pos = []
             dirty_pos = []
             agent_pos = []
@@ -369,9 +382,9 @@ class GUI(Frame):
             
             env = MAACEnv(n_agent=len(agent_pos), n_row=self.n_row, n_col=self.n_col, 
                         obstacle_pos=obstacle_pos, dirty_pos=dirty_pos, agent_pos=agent_pos)
-            env.render_callback = self.render
             
             self.main.env = env
+            self.main.frames = FrameStream(self.n_row, self.n_col)
             self.main.prepare()
             self.set_gui_mode(GUI.FIXED)
             self.exported_env = True
@@ -379,6 +392,9 @@ class GUI(Frame):
         self.running_thread = Thread(target=self.main.run, daemon=True)
         self.running_thread.start()
         self.env_status.config(text='학습 중')
+        if not self.polling:
+            self.polling = True
+            self.after(GUI.FRAME_INTERVAL, self.poll_frames)
         
     def stop_learn(self):
         self.main.force_stop = True
@@ -396,34 +412,144 @@ class GUI(Frame):
         self.run_status.config(text='학습 환경 입력 중')
         self.set_gui_mode(GUI.OBSTACLE)
         
-    def render(self, steps=None, visited_layer=None, agents_info=None, 
-               visual=None, **kwargs):
-        # TODO update status bar
-        status = []
-        if 'episode' in kwargs:
-            status.append('에피소드 {}'.format(kwargs['episode']))
-        status.append('{} 스텝'.format(steps))
-        
-        self.run_status.config(text=', '.join(status))
+    def attach(self, address=None, authkey=None):
+        # headless 학습 (train.py --live)에 뷰어로 연결
+        if self.running_thread is not None or self.live_conn is not None:
+            return
+        if address is None:
+            address = askstring('', '학습 주소를 입력하세요. (host:port)')
+        if address is None:
+            return
+        authkey = live.resolve_authkey(authkey)
+        if authkey is None:
+            authkey = askstring('', '학습 key를 입력하세요. (train.py가 출력한 live viewer key)', show='*')
+        if not authkey:
+            return
         
-        if visual is None:
+        self.live_conn, scenario = live.attach(live.parse_address(address), authkey)
+        self.load_scenario(scenario)
+        self.env_status.config(text='학습 보기 ({})'.format(address))
+        self.after(GUI.FRAME_INTERVAL, self.poll_live)
+    
+    def load_scenario(self, scenario):
+        # 뷰어/플레이어용: scenario로 화면을 다시 그리고 편집 불가 모드로
+        env = MAACEnv.from_scenario(scenario)
+        self.gui_mode = GUI.OBSTACLE
+        self.remove_all(GUI.AGENT)
+        self.remove_all(GUI.OBSTACLE)
+        self.remove_all(GUI.DIRTY)
+        self.init_with_env(env)
+        self.idx_to_agent = {i: self.pos_to_agent[tuple(pos)] for i, pos in enumerate(scenario['agents'])}
+        self.set_gui_mode(GUI.FIXED)
+        # main.prepare()는 하지 않았으므로, 연결이 끊긴 뒤 학습하면 화면의 scenario로 env를 새로 만듦
+        self.exported_env = False
+    
+    def open_trajectory(self, directory=None, episode=None, speed=10):
+        # TrajectoryRecorder로 저장된 에피소드 재생 (정책은 다시 돌리지 않음)
+        if self.running_thread is not None or self.live_conn is not None or self.trajectories is not None:
+            return
+        if directory is None:
+            directory = askdirectory()
+        if not directory:
             return
         
-        for row, col in np.argwhere(visited_layer == -1):
-            cell = self.pos_to_cell[row, col]
-            cell.visited = False
-            cell.draw()
-        for row, col in np.argwhere(visited_layer != -1):
-            cell = self.pos_to_cell[row, col]
-            agent = agents_info[visited_layer[row, col]]
-            pos = agent['pos']
-            if pos not in self.pos_to_agent:
-                continue
-            color = self.pos_to_agent[pos[0], pos[1]].color
-            cell.visited = True
-            cell.visited_color = color
+        self.trajectories = TrajectoryReader(directory)
+        if not len(self.trajectories):
+            self.trajectories = None
+            self.env_status.config(text='기록된 에피소드 없음')
+            return
+        self.load_scenario(self.trajectories.scenario)
+        self.env_status.config(text='기록 보기 ({} 에피소드)'.format(len(self.trajectories)))
+        
+        self.player_bar = Frame(self.master, bd=1)
+        self.player_bar.grid(row=2, column=0, sticky=(E, W))
+        Button(self.player_bar, text='◀', command=lambda: self.seek_episode(-1)).pack(side='left')
+        self.play_btn = Button(self.player_bar, text='재생', width=4, command=self.toggle_play)
+        self.play_btn.pack(side='left')
+        Button(self.player_bar, text='▶', command=lambda: self.seek_episode(1)).pack(side='left')
+        self.step_scale = Scale(self.player_bar, orient=HORIZONTAL, label='스텝', showvalue=True,
+                                command=lambda t: self.show_step(int(t)))
+        self.step_scale.pack(side='left', fill=X, expand=True)
+        self.speed_scale = Scale(self.player_bar, orient=HORIZONTAL, label='스텝/초', from_=1, to=100)
+        self.speed_scale.set(speed)
+        self.speed_scale.pack(side='left')
+        
+        self.playing = False
+        if episode is None or episode not in self.trajectories.index:
+            episode = self.trajectories.episodes[0]
+        self.play_episode(episode)
+    
+    def play_episode(self, episode):
+        self.trajectory = self.trajectories[episode]
+        self.step_scale.config(from_=0, to=len(self.trajectory) - 1)
+        self.step_scale.set(0)
+        self.show_step(0)
+    
+    def seek_episode(self, offset):
+        episodes = self.trajectories.episodes
+        idx = episodes.index(self.trajectory.episode) + offset
+        if 0 <= idx < len(episodes):
+            self.play_episode(episodes[idx])
+    
+    def show_step(self, t):
+        self.step = t
+        self.render_frame(self.trajectory.frame(t))
+        self.run_status.config(text='에피소드 {}, {} 스텝, 점수 {:.0f}'.format(
+            self.trajectory.episode, t, self.trajectory.rewards[:t+1].sum()))
+    
+    def toggle_play(self):
+        self.playing = not self.playing
+        self.play_btn.config(text='정지' if self.playing else '재생')
+        if self.playing:
+            self.play_job = self.after(1000 // self.speed_scale.get(), self.play_next)
+        else:
+            self.after_cancel(self.play_job)
+    
+    def play_next(self):
+        if self.step + 1 >= len(self.trajectory):
+            self.toggle_play()
+            return
+        self.step_scale.set(self.step + 1)
+        self.show_step(self.step + 1)
+        self.play_job = self.after(1000 // self.speed_scale.get(), self.play_next)
+    
+    def poll_live(self):
+        # 받은 frame diff를 전부 합쳐서 한번에 그림
+        frames = []
+        try:
+            while self.live_conn.poll():
+                frames.append(self.live_conn.recv())
+        except (OSError, EOFError):
+            self.live_conn.close()
+            self.live_conn = None
+            self.env_status.config(text='학습 보기 연결 끊김')
+            return
+        frame = merge_frames(frames)
+        if frame is not None:
+            self.render_frame(frame)
+        self.after(GUI.FRAME_INTERVAL, self.poll_live)
+    
+    def poll_frames(self):
+        # 학습 스레드는 frame을 queue에 넣기만 하고, 그리기는 Tk main loop에서
+        frame = self.main.frames.pop()
+        if frame is not None:
+            self.render_frame(frame)
+        else:
+            self.run_status.config(text='에피소드 {}, 총 {} 스텝'.format(
+                self.main.game_progress, self.main.total_steps))
+        self.after(GUI.FRAME_INTERVAL, self.poll_frames)
+    
+    def render_frame(self, frame):
+        # 바뀐 cell만 다시 그림
+        self.run_status.config(text='에피소드 {}, {} 스텝'.format(frame['episode'], frame['steps']))
+        for cell_idx, visited, dirty in zip(frame['cells'], frame['visited'], frame['dirty']):
+            cell = self.pos_to_cell[divmod(int(cell_idx), self.n_col)]
+            cell.visited = visited != -1
+            if cell.visited:
+                cell.visited_color = self.idx_to_agent[int(visited)].color
+            cell.dirty = dirty == 1
             cell.draw()
-        self.move_agent_along(agents_info)
+        self.move_agent_along({i: {'new_pos': tuple(pos)} for i, pos in enumerate(frame['agent_pos'])})
 
 class Cell:
     def __init__(self, canvas, row, col):
@@ -435,6 +561,7 @@ class Cell:
         self.visited = False
         
         self.rect = None
+        self.color = None
         self.draw()
     
     def draw(self):
@@ -452,7 +579,9 @@ class Cell:
             color = self.visited_color
         elif self.dirty:
             color ='gray90'
-        self.canvas.itemconfig(self.rect, fill=color)
+        if color != self.color:
+            self.canvas.itemconfig(self.rect, fill=color)
+            self.color = color
 
     def onclick(self, event):
         if event['mode'] == GUI.OBSTACLE:
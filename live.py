@@ -0,0 +1,78 @@
+import os
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from render import FrameStream
+
+# 연결로 pickle을 주고받으므로 key는 고정하지 않고 인자나 이 환경 변수로 받음
+AUTHKEY_ENV = 'MAAC_LIVE_AUTHKEY'
+
+
+def resolve_authkey(authkey=None):
+    # 인자 > 환경 변수, 둘 다 없으면 None
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def parse_address(address):
+    # 'host:port' or 'port' -> (host, port)
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+class LiveServer:
+    """Lets a GUI viewer attach to a running (headless) training job.
+
+    A viewer that connects first receives the env scenario, then the frame
+    diffs pushed to self.frames (a FrameStream) while it stays connected.
+    Nothing is pushed while no viewer is connected.
+
+    Viewers must present authkey (or MAAC_LIVE_AUTHKEY); without either a
+    random key is generated and printed. A bare port binds to localhost.
+    """
+    def __init__(self, address, scenario, max_frames=8, authkey=None):
+        self.authkey = resolve_authkey(authkey)
+        if self.authkey is None:
+            self.authkey = secrets.token_hex(16).encode()
+            print('live viewer key ({}): {}'.format(AUTHKEY_ENV, self.authkey.decode()))
+        self.listener = Listener(address, authkey=self.authkey)
+        self.scenario = scenario
+        self.frames = FrameStream(scenario['n_row'], scenario['n_col'], max_frames)
+        self.frames.watching = False
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                continue # key가 틀린 연결은 버리고 다음 뷰어를 기다림
+            except OSError:
+                return
+            try:
+                conn.send(self.scenario)
+                self.frames.reset()
+                self.frames.watching = True
+                while True:
+                    conn.send(self.frames.frames.get())
+            except (OSError, EOFError):
+                pass
+            finally:
+                self.frames.watching = False
+                conn.close()
+
+    def close(self):
+        self.listener.close()
+
+
+def attach(address, authkey=None):
+    """Connects to a LiveServer; returns (connection, scenario)."""
+    authkey = resolve_authkey(authkey)
+    if authkey is None:
+        raise ValueError('attaching needs the LiveServer key (authkey or {})'.format(AUTHKEY_ENV))
+    conn = Client(address, authkey=authkey)
+    return conn, conn.recv()
@@ -1,23 +1,104 @@
+import numpy as np
 import torch as T
 import torch.nn.functional as F
-from agent import Agent
+from accelerate import Accelerator
+from agent import Agent, AgentEnsemble, SharedAgent, soft_update
+from networks import ActorEnsemble, CompactEncoder, GridEncoder
+from prefetch import sample_arrays, to_tensors
+from profiler import PhaseTimer
+
+# torch.inference_mode only exists from torch 1.9
+inference_mode = getattr(T, 'inference_mode', T.no_grad)
 
 class MADDPG:
     def __init__(self, actor_dims, critic_dims, n_agents, n_actions, 
                  scenario='simple',  alpha=0.01, beta=0.01, fc1=64, 
-                 fc2=64, gamma=0.99, tau=0.01, chkpt_dir='tmp/maddpg/'):
+                 fc2=64, gamma=0.99, tau=0.01, chkpt_dir='tmp/maddpg/', ensemble=False,
+                 network='mlp', grid=None, shared=False, accelerate=None, bf16=False, segments=None):
         self.agents = []
         self.n_agents = n_agents
         self.n_actions = n_actions
+        self.actor_offsets = np.cumsum([0] + list(actor_dims))
+        # learn 안쪽 phase 시간 측정 (Main.profile), 기본은 꺼져 있음
+        self.timer = PhaseTimer(enabled=False)
         chkpt_dir += scenario 
-        for agent_idx in range(self.n_agents):
-            self.agents.append(Agent(actor_dims[agent_idx], critic_dims,  
-                            n_actions, n_agents, agent_idx, alpha=alpha, beta=beta,
-                            chkpt_dir=chkpt_dir))
-
+        # forward pass를 TorchScript/torch.compile graph로, bf16이면 CPU bfloat16 autocast
+        self.accelerator = None
+        if accelerate is not None or bf16:
+            self.accelerator = Accelerator(accelerate, bf16=bf16)
+
+        # network='cnn': grid=(n_row, n_col, visual_field) of a dense observation,
+        # one GridEncoder per role shared by all agents
+        encoders = None
+        if network == 'cnn':
+            if grid is None:
+                raise ValueError("network='cnn' needs grid=(n_row, n_col, visual_field)")
+            encoders = {role: GridEncoder(*grid)
+                        for role in ('actor', 'critic', 'target_actor', 'target_critic')}
+        # network='embed': segments=(coord_dims, window_dims, map_dims) of a compact
+        # observation (CompactObservationBuilder.segments), one CompactEncoder per role
+        elif network == 'embed':
+            if segments is None:
+                raise ValueError("network='embed' needs segments=(coord_dims, window_dims, map_dims)")
+            encoders = {role: CompactEncoder(*segments)
+                        for role in ('actor', 'critic', 'target_actor', 'target_critic')}
+        elif network != 'mlp':
+            raise ValueError("network must be 'mlp', 'cnn' or 'embed'")
+
+        # shared: 모든 에이전트가 actor/critic 하나를 공유 (SharedAgent), self.agents는 그 하나만
+        self.shared = shared
+        if shared:
+            if len(set(actor_dims)) != 1:
+                raise ValueError('shared mode needs every agent to have the same actor_dims')
+            self.agents.append(SharedAgent(actor_dims[0], critic_dims, n_actions, n_agents,
+                               alpha=alpha, beta=beta, chkpt_dir=chkpt_dir, encoders=encoders))
+        else:
+            for agent_idx in range(self.n_agents):
+                self.agents.append(Agent(actor_dims[agent_idx], critic_dims,  
+                                n_actions, n_agents, agent_idx, alpha=alpha, beta=beta,
+                                chkpt_dir=chkpt_dir, encoders=encoders))
+
+        # 공유 encoder가 에이전트 수만큼 soft update 되지 않도록 중복 제거
+        self.params, self.target_params = [], []
+        seen = set()
+        for agent in self.agents:
+            for target_param, param in zip(agent.target_params, agent.params):
+                if id(param) not in seen:
+                    seen.add(id(param))
+                    self.params.append(param)
+                    self.target_params.append(target_param)
+
+        # all agents' networks stacked per role, trained with batched matmuls
+        # (the shared agent has the same interface and is trained the same way)
+        self.ensemble = None
+        if shared:
+            self.ensemble = self.agents[0]
+        elif ensemble:
+            if len(set(actor_dims)) != 1:
+                raise ValueError('ensemble mode needs every agent to have the same actor_dims')
+            self.ensemble = AgentEnsemble(self.agents)
+
+        # 역할별로 step할 optimizer: 에이전트 (또는 ensemble) 네트워크의 head마다 하나,
+        # 공유 encoder는 encoder.optimizer 하나로 learn마다 한 번만
+        learners = self.agents if self.ensemble is None else [self.ensemble]
+        self.optimizers = {role: [getattr(learner, role).optimizer for learner in learners]
+                           for role in ('actor', 'critic')}
+        if encoders is not None:
+            for role, optimizers in self.optimizers.items():
+                optimizers.append(encoders[role].optimizer)
+
+        # stacked copy of the actors so choose_action is one forward pass for
+        # the whole team; refreshed whenever the actors change
+        self.inference_actor = None
+        if self.ensemble is not None:
+            self.inference_actor = self.ensemble.actor
+        elif len(set(actor_dims)) == 1:
+            self.inference_actor = ActorEnsemble(alpha, [agent.actor for agent in self.agents])
 
     def save_checkpoint(self):
         print('... saving checkpoint ...')
+        if self.ensemble is not None and not self.shared:
+            self.ensemble.store_to_agents()
         for agent in self.agents:
             agent.save_models()
 
@@ -25,65 +106,136 @@ class MADDPG:
         print('... loading checkpoint ...')
         for agent in self.agents:
             agent.load_models()
-
-    def choose_action(self, raw_obs):
-        actions = []
-        for agent_idx, agent in enumerate(self.agents):
-            action = agent.choose_action(raw_obs[agent_idx])
-            actions.append(action)
-        return actions
+        if self.shared:
+            return
+        if self.ensemble is not None:
+            self.ensemble.load_from_agents()
+        elif self.inference_actor is not None:
+            self.inference_actor.load_members()
+
+    def update_network_parameters(self, tau=None):
+        # every agent's targets in one call
+        if tau is None:
+            tau = self.agents[0].tau
+        soft_update(self.target_params, self.params, tau)
+
+    def forward(self, network, *inputs):
+        if self.accelerator is None:
+            return network.forward(*inputs)
+        return self.accelerator(network, *inputs)
+
+    def choose_action(self, raw_obs, mask=None):
+        # (n_agents, n_actions), mask: (n_agents, n_actions) bool (env.get_action_mask())
+        if self.inference_actor is None:
+            return np.array([agent.choose_action(raw_obs[agent_idx], None if mask is None else mask[agent_idx])
+                             for agent_idx, agent in enumerate(self.agents)])
+
+        device = self.inference_actor.device
+        with inference_mode():
+            state = T.as_tensor(np.asarray(raw_obs, dtype=np.float32)[:, None, :]).to(device)
+            if mask is None:
+                actions = self.forward(self.inference_actor, state)[:, 0]
+            else:
+                mask = T.as_tensor(np.asarray(mask, dtype=bool)[:, None, :]).to(device)
+                actions = self.forward(self.inference_actor, state, mask)[:, 0]
+                mask = mask[:, 0]
+            noise = T.rand(actions.shape, device=device)
+            action = actions + noise
+            if mask is not None:
+                action = action * mask # 막힌 action은 noise로도 argmax가 되지 않게
+
+        return action.cpu().numpy()
+
+    def sample(self, memory, device):
+        # (states, actions, rewards, states_, dones, batch, weights) as tensors,
+        # see prefetch.sample_tensors
+        if memory.prefetched:
+            with self.timer('learn/sample_buffer'):
+                return memory.get()
+        with self.timer('learn/sample_buffer'):
+            samples = sample_arrays(memory)
+        with self.timer('learn/to_tensor'):
+            return to_tensors(device, *samples)
+
+    def actor_states(self, states):
+        return [states[:, start:end] for start, end in
+                zip(self.actor_offsets[:-1], self.actor_offsets[1:])]
+
+    def act(self, role, states):
+        # (batch_size, n_agents*n_actions) actions of every agent's role ('actor' or
+        # 'target_actor') from the global states
+        if self.ensemble is None:
+            return T.cat([self.forward(getattr(agent, role), actor_state)
+                          for agent, actor_state in zip(self.agents, self.actor_states(states))], dim=1)
+        # agents first: (n_agents, batch_size, actor_dims)
+        batch_size = states.shape[0]
+        actor_states = states.view(batch_size, self.n_agents, -1).transpose(0, 1)
+        actions = self.forward(getattr(self.ensemble, role), actor_states)
+        return actions.transpose(0, 1).reshape(batch_size, -1)
+
+    def evaluate(self, role, states, actions):
+        # (n_agents, batch_size) Q of every agent's role ('critic' or 'target_critic'),
+        # actions: (n_agents, batch_size, n_agents*n_actions), one row per agent
+        if self.ensemble is None:
+            return T.stack([self.forward(getattr(agent, role), states, actions[agent_idx]).flatten()
+                            for agent_idx, agent in enumerate(self.agents)])
+        return self.forward(getattr(self.ensemble, role), states, actions).squeeze(2)
+
+    def optimize(self, role, loss):
+        # every optimizer of the role: agent (or ensemble) heads and the shared encoder
+        with self.timer('learn/backward'):
+            for role_optimizer in self.optimizers[role]:
+                role_optimizer.zero_grad()
+            loss.backward()
+        with self.timer('learn/optimizer'):
+            for role_optimizer in self.optimizers[role]:
+                role_optimizer.step()
 
     def learn(self, memory):
         if not memory.ready():
             return
-
-        actor_states, states, actions, rewards, \
-        actor_new_states, states_, dones = memory.sample_buffer()
+        self.timer.count('learn_steps')
 
         device = self.agents[0].actor.device
-
-        states = T.tensor(states, dtype=T.float).to(device)
-        actions = T.tensor(actions, dtype=T.float).to(device)
-        rewards = T.tensor(rewards).to(device)
-        states_ = T.tensor(states_, dtype=T.float).to(device)
-        dones = T.tensor(dones).to(device)
-
-        all_agents_new_actions = []
-        all_agents_new_mu_actions = []
-        old_agents_actions = []
-
-        for agent_idx, agent in enumerate(self.agents):
-            new_states = T.tensor(actor_new_states[agent_idx], 
-                                 dtype=T.float).to(device)
-
-            new_pi = agent.target_actor.forward(new_states)
-
-            all_agents_new_actions.append(new_pi)
-            mu_states = T.tensor(actor_states[agent_idx], 
-                                 dtype=T.float).to(device)
-            pi = agent.actor.forward(mu_states)
-            all_agents_new_mu_actions.append(pi)
-            old_agents_actions.append(actions[agent_idx])
-
-        new_actions = T.cat([acts for acts in all_agents_new_actions], dim=1)
-        mu = T.cat([acts for acts in all_agents_new_mu_actions], dim=1)
-        old_actions = T.cat([acts for acts in old_agents_actions],dim=1)
-
-        for agent_idx, agent in enumerate(self.agents):
-            critic_value_ = agent.target_critic.forward(states_, new_actions).flatten()
-            critic_value_[dones[:,0]] = 0.0
-            critic_value = agent.critic.forward(states, old_actions).flatten()
-
-            target = rewards[:,agent_idx] + agent.gamma*critic_value_.clone().detach()
-            critic_loss = F.mse_loss(target, critic_value)
-            agent.critic.optimizer.zero_grad()
-            critic_loss.backward(retain_graph=True)
-            agent.critic.optimizer.step()
-
-            actor_loss = agent.critic.forward(states, mu).flatten()
-            actor_loss = -T.mean(actor_loss)
-            agent.actor.optimizer.zero_grad()
-            actor_loss.backward(retain_graph=True)
-            agent.actor.optimizer.step()
-
-            agent.update_network_parameters()
+        forward = self.timer('learn/forward')
+
+        states, actions, rewards, states_, dones, batch, weights = self.sample(memory, device)
+        old_actions = actions.reshape(actions.shape[0], -1).expand(self.n_agents, -1, -1)
+
+        # every agent's target Q in one pass, nothing kept for backward
+        with forward:
+            with T.no_grad():
+                new_actions = self.act('target_actor', states_).expand(self.n_agents, -1, -1)
+                critic_value_ = self.evaluate('target_critic', states_, new_actions)
+                critic_value_[:, dones[:,0]] = 0.0
+                target = rewards.t() + self.agents[0].gamma*critic_value_
+
+            critic_value = self.evaluate('critic', states, old_actions)
+            # sum of the per-agent losses: each critic only sees its own loss
+            critic_loss = F.mse_loss(critic_value, target, reduction='none')
+            if weights is not None:
+                critic_loss = critic_loss * weights
+            critic_loss = critic_loss.mean(dim=1).sum()
+        self.optimize('critic', critic_loss)
+
+        if batch is not None:
+            td_errors = (target - critic_value).detach().abs().max(dim=0)[0]
+            memory.update_priorities(batch, td_errors.cpu().numpy())
+
+        # actor graph built once, after the critic step; agent i's critic only
+        # backpropagates into agent i's own actor
+        with forward:
+            mu = self.act('actor', states)
+            own_action = T.eye(self.n_agents, dtype=T.bool, device=device)
+            own_action = own_action.repeat_interleave(self.n_actions, dim=1).unsqueeze(1)
+            mu = T.where(own_action, mu, mu.detach())
+            actor_loss = -self.evaluate('critic', states, mu).mean(dim=1).sum()
+        self.optimize('actor', actor_loss)
+
+        with self.timer('learn/update_network_parameters'):
+            if self.ensemble is not None:
+                self.ensemble.update_network_parameters()
+            else:
+                self.update_network_parameters()
+                if self.inference_actor is not None:
+                    self.inference_actor.load_members()
@@ -1,18 +1,20 @@
+import json
 import threading
-from tkinter import Tk
 import numpy as np
-from gui import GUI
 from maddpg import MADDPG
-from buffer import MultiAgentReplayBuffer
+from buffer import MultiAgentReplayBuffer, CompactMultiAgentReplayBuffer, MemmapMultiAgentReplayBuffer, \
+                   PrioritizedMultiAgentReplayBuffer
 # from make_env import make_env
 from environment import MAACEnv
+from prefetch import BatchPrefetcher
+from rollout import ParallelRollout
+from trajectory import TrajectoryRecorder
+from profiler import PhaseTimer, CaptureWindow, write_report, summary
 import time
 
-def obs_list_to_state_vector(observation):
-    state = np.array([])
-    for obs in observation:
-        state = np.concatenate([state, obs])
-    return state
+def state_vector(observation):
+    # (n_agents, obs_dim) 관측 배열을 이어 붙인 global state, 복사 없이 view
+    return np.reshape(observation, -1)
 
 
 class Main:
@@ -20,13 +22,37 @@ class Main:
     N_GAMES = 50000
     MAX_STEPS = 100
     
-    def __init__(self):
-        self.env = MAACEnv()
+    def __init__(self, env=None):
+        self.env = env if env is not None else MAACEnv()
     
         # configs
         self.evaluate = False
         self.load_chkpt = True
         self.force_render = False
+        self.ensemble = False # 에이전트 네트워크를 쌓아서 한번에 학습
+        self.network = 'mlp' # 'cnn': 맵 layer를 에이전트끼리 공유하는 CNN으로 인코딩 (dense obs_mode만)
+                             # 'embed': 좌표, window, dirt map을 따로 embedding (compact obs_mode만)
+        self.shared_params = False # 모든 에이전트가 actor/critic 하나를 공유 (agent id one-hot 입력)
+        self.accelerate = None # 'script': TorchScript trace, 'compile': torch.compile (torch 2)
+        self.bf16 = False # CPU bfloat16 autocast (weight/optimizer는 float32 유지)
+        self.action_mask = False # 벽, 장애물로 막힌 action은 고르지 않음 (env.get_action_mask)
+        self.buffer_obs_dtype = 'bits' # None이면 float64 MultiAgentReplayBuffer 사용
+        self.buffer_on_disk = False # 체크포인트 옆에 replay buffer를 memmap으로 저장하고 이어서 학습
+        self.prioritized_replay = False # TD error 기반 prioritized experience replay
+        self.prefetch_batches = False # 학습 배치를 별도 스레드에서 미리 샘플링
+        self.rollout_workers = 0 # 0보다 크면 그 수만큼 프로세스에서 에피소드를 돌리고 여기서는 학습만 (렌더링 없음)
+        self.chkpt_dir = '.\\tmp\\maddpg\\'
+        self.log_interval = Main.PRINT_INTERVAL # 에피소드 단위 진행 로그 주기
+        self.log_file = None # 진행 로그를 json lines로 저장할 경로
+        self.log_steps = False # step마다 info 출력 (디버깅용)
+        self.frames = None # FrameStream, 보고 있는 뷰어(GUI, LiveServer)가 있으면 frame diff 전송
+        self.record_dir = None # 에피소드 궤적을 저장할 디렉토리 (trajectory.py, replay.py로 재생)
+        self.record_period = 1 # record 1 game per n games
+        self.profile = False # phase별 시간 측정, log_interval마다 출력
+        self.profile_file = None # phase별 시간을 저장할 경로 (.json: json lines, .csv)
+        self.profile_episode = None # 이 에피소드부터 torch.profiler/cProfile 실행
+        self.profile_episodes = 1
+        self.profile_tool = 'torch' # 'torch' 또는 'cprofile'
         
         # subroutine control (GUI is main thread)
         self.force_stop = False
@@ -35,6 +61,19 @@ class Main:
         
     def prepare(self):
         scenario = '{}_agent_{}_by_{}'.format(self.env.n_agent, self.env.n_row, self.env.n_col)
+        if self.env.obs_mode != 'dense':
+            scenario += '_' + self.env.obs_mode # 관측 크기가 달라서 체크포인트 분리
+        if self.network == 'cnn' and self.env.obs_mode != 'dense':
+            raise ValueError("network='cnn' needs the dense obs_mode")
+        if self.network == 'embed' and self.env.obs_mode != 'compact':
+            raise ValueError("network='embed' needs the compact obs_mode")
+        if self.prioritized_replay and self.buffer_on_disk:
+            # sum tree는 메모리에만 있어서 memmap buffer로 저장/재개할 수 없음
+            raise ValueError('prioritized_replay does not support buffer_on_disk')
+        if self.network != 'mlp':
+            scenario += '_' + self.network
+        if self.shared_params:
+            scenario += '_shared'
         print('preparing scenario:', scenario)
         
         self.total_steps = 0
@@ -51,14 +90,48 @@ class Main:
         # action space is a list of arrays, assume each agent has same action space
         self.n_actions = self.env.action_space[0].n
         print(self.n_agents, actor_dims, critic_dims, self.n_actions)        
+        chkpt_dir = self.chkpt_dir
         self.maddpg_agents = MADDPG(actor_dims, critic_dims, self.n_agents, self.n_actions, 
                                     fc1=64, fc2=64,  
                                     alpha=0.01, beta=0.01, scenario=scenario,
-                                    chkpt_dir='.\\tmp\\maddpg\\')
+                                    chkpt_dir=chkpt_dir, ensemble=self.ensemble, network=self.network,
+                                    grid=(self.env.n_row, self.env.n_col, self.env.visual_field),
+                                    segments=getattr(self.env.observer, 'segments', None),
+                                    shared=self.shared_params, accelerate=self.accelerate, bf16=self.bf16)
 
-        self.memory = MultiAgentReplayBuffer(
-            1000000, critic_dims, actor_dims, self.n_actions, self.n_agents, 
-            batch_size=1024)
+        # 0/1이 아닌 관측(compact obs_mode)은 bit packing 불가
+        obs_dtype = self.buffer_obs_dtype
+        if obs_dtype == 'bits' and not self.env.observer.binary:
+            obs_dtype = 'float32'
+
+        if self.prioritized_replay:
+            self.memory = PrioritizedMultiAgentReplayBuffer(
+                1000000, critic_dims, actor_dims, self.n_actions, self.n_agents, 
+                batch_size=1024, obs_dtype=obs_dtype or 'float32')
+        elif self.buffer_on_disk:
+            self.memory = MemmapMultiAgentReplayBuffer(
+                1000000, critic_dims, actor_dims, self.n_actions, self.n_agents, 
+                batch_size=1024, buffer_dir=chkpt_dir + scenario + '_buffer',
+                obs_dtype=obs_dtype or 'float32', resume=self.load_chkpt)
+        elif obs_dtype is None:
+            self.memory = MultiAgentReplayBuffer(
+                1000000, critic_dims, actor_dims, self.n_actions, self.n_agents, 
+                batch_size=1024)
+        else:
+            self.memory = CompactMultiAgentReplayBuffer(
+                1000000, critic_dims, actor_dims, self.n_actions, self.n_agents, 
+                batch_size=1024, obs_dtype=obs_dtype)
+
+        self.recorder = None
+        if self.record_dir is not None:
+            self.recorder = TrajectoryRecorder(self.record_dir, self.env.scenario())
+        
+        self.timer = PhaseTimer(enabled=self.profile, counters=('env_steps', 'learn_steps'))
+        self.maddpg_agents.timer = self.timer
+        self.capture = None
+        if self.profile_episode is not None:
+            self.capture = CaptureWindow(self.profile_episode, self.profile_episodes, self.profile_tool,
+                                         path='profile_{}_{}'.format(scenario, self.profile_episode))
         
         print('preparation done')
     
@@ -69,49 +142,82 @@ class Main:
                 self.maddpg_agents.load_checkpoint()
             except FileNotFoundError:
                 print('no checkpoint found')
-            
-        for i in range(self.game_progress, Main.N_GAMES):
+
+        # 배치 prefetch thread는 이 run 동안만 두고, 끝나면 (예외여도) 닫고 buffer를 되돌림
+        if self.prefetch_batches:
+            self.memory = BatchPrefetcher(self.memory, self.maddpg_agents.agents[0].actor.device)
+        try:
+            if self.rollout_workers > 0 and not self.evaluate:
+                self.run_parallel()
+            else:
+                self.run_serial()
+        finally:
+            if self.memory.prefetched:
+                self.memory.close()
+                self.memory = self.memory.memory
+        print('thread finished')
+
+    def run_serial(self):
+        self.log_start()
+        timer = self.timer
+        for i in range(self.game_progress, self.N_GAMES):
             """ episode loop """
-            print('episode', i, 'total steps', self.total_steps)
             
             self.game_progress = i
+            if self.capture is not None:
+                self.capture.episode_start(i)
             obs = self.env.reset()
+            state = state_vector(obs)
             score = 0
             done = [False]*self.n_agents
             episode_step = 0
+            render = self.frames is not None and \
+                (self.force_render or self.evaluate or i % self.game_render_period == 0)
+            record = self.recorder is not None and i % self.record_period == 0
+            if record:
+                self.recorder.start_episode(i, self.env.get_positions())
             
             while not any(done):
                 """ step loop """
                 
-                if self.force_render or self.evaluate or i % self.game_render_period == 0:
-                    self.env.render(visual=True, episode=self.game_progress, **self.env.get_info())
-                    time.sleep(0.1) # to slow down the action for the video
-                else:
-                    self.env.render(episode=self.game_progress, **self.env.get_info())
+                # 뷰어가 밀려 있으면 frame은 버려지고 학습은 기다리지 않음
+                if render and self.frames.watching:
+                    with timer('render'):
+                        self.frames.push(self.game_progress, **self.env.get_info())
                 
                 # random actions
                 # actions = [np.array([np.random.rand() for _ in range(self.n_actions)]) for _ in range(self.n_agents)]
                 
-                actions = self.maddpg_agents.choose_action(obs)
-                obs_, reward, done, info = self.env.step(actions)
+                with timer('choose_action'):
+                    mask = self.env.get_action_mask() if self.action_mask else None
+                    actions = self.maddpg_agents.choose_action(obs, mask)
+                with timer('env.step'):
+                    obs_, reward, done, info = self.env.step(actions)
+                timer.count('env_steps')
+                if record:
+                    with timer('record'):
+                        self.recorder.record_step(self.env.get_positions(), reward, self.env.cleaned)
                 
-                print('@@@ step', episode_step, ', info\n', info)
+                if self.log_steps:
+                    print('@@@ step', episode_step, ', info\n', info)
 
-                state = obs_list_to_state_vector(obs)
-                state_ = obs_list_to_state_vector(obs_)
+                # 이전 step의 state_를 그대로 state로 씀
+                state_ = state_vector(obs_)
 
                 if all(done):
                     self.fastest_solve = min(self.fastest_solve, episode_step)
 
-                if episode_step >= Main.MAX_STEPS:
+                if episode_step >= self.MAX_STEPS:
                     done = [True]*self.n_agents
 
-                self.memory.store_transition(obs, state, actions, reward, obs_, state_, done)
+                with timer('store_transition'):
+                    self.memory.store_transition(obs, state, actions, reward, obs_, state_, done)
 
                 if self.total_steps % 100 == 0 and not self.evaluate:
-                    self.maddpg_agents.learn(self.memory)
+                    with timer('learn'):
+                        self.maddpg_agents.learn(self.memory)
 
-                obs = obs_
+                obs, state = obs_, state_
 
                 score += sum(reward)
                 self.total_steps += 1
@@ -122,14 +228,19 @@ class Main:
                 
             self.score_history.append(score)
             avg_score = np.mean(self.score_history[-100:])
+            if record:
+                self.recorder.end_episode()
+            if self.capture is not None:
+                self.capture.episode_end(i, force=self.force_stop)
             
             if not self.evaluate:
                 if avg_score > self.best_score:
-                    self.save_checkpoint()
+                    with timer('checkpoint'):
+                        self.save_checkpoint()
                     self.best_score = avg_score
                     
-            if i % self.PRINT_INTERVAL == 0 and i > 0:
-                print('episode', i, 'average score {:.1f}'.format(avg_score))
+            if i % self.log_interval == 0 and i > 0:
+                self.log_progress(i, avg_score)
                 
             if self.force_stop:
                 self.save_checkpoint()
@@ -138,12 +249,92 @@ class Main:
             
             self.force_render = False
             
-        print('thread finished')
+        if self.recorder is not None:
+            self.recorder.flush()
+
+    def run_parallel(self):
+        rollout = ParallelRollout(self.env, self.maddpg_agents, self.memory,
+                                  n_workers=self.rollout_workers, max_steps=self.MAX_STEPS,
+                                  action_mask=self.action_mask, max_episodes=self.N_GAMES)
+        self.log_start()
+        rollout.start()
+        try:
+            while len(rollout.score_history) < self.N_GAMES and not self.force_stop:
+                n_games = len(rollout.score_history)
+                with self.timer('rollout.step'):
+                    n = rollout.step()
+                if n == 0 and len(rollout.score_history) == n_games:
+                    time.sleep(0.001)
+                    continue
+                self.timer.count('env_steps', n)
+                self.total_steps = rollout.total_steps
+                self.score_history = rollout.score_history
+                if len(self.score_history) == n_games:
+                    continue
+                
+                self.game_progress = len(self.score_history)
+                avg_score = np.mean(self.score_history[-100:])
+                if avg_score > self.best_score:
+                    self.save_checkpoint()
+                    self.best_score = avg_score
+                
+                if n_games // self.log_interval != self.game_progress // self.log_interval:
+                    self.log_progress(self.game_progress, avg_score)
+        finally:
+            rollout.close()
+            
+        if self.force_stop:
+            self.save_checkpoint()
+            self.force_stop = False
+
+    def log_start(self):
+        self.log_time = time.time()
+        self.log_total_steps = self.total_steps
+        self.timer.reset()
+
+    def log_progress(self, episode, avg_score):
+        now = time.time()
+        record = {
+            'time': now,
+            'episode': episode,
+            'total_steps': self.total_steps,
+            'steps_per_sec': (self.total_steps - self.log_total_steps) / max(now - self.log_time, 1e-9),
+            'avg_score': float(avg_score),
+            'best_score': float(self.best_score) if np.isfinite(self.best_score) else None,
+            'fastest_solve': int(self.fastest_solve) if np.isfinite(self.fastest_solve) else None,
+        }
+        self.log_time = now
+        self.log_total_steps = self.total_steps
+
+        print('episode', episode, 'total steps', self.total_steps,
+              'average score {:.1f}'.format(avg_score))
+        if self.log_file is not None:
+            with open(self.log_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        
+        if self.timer.enabled:
+            report = self.timer.report()
+            print('profile:', summary(report))
+            if self.profile_file is not None:
+                write_report(self.profile_file, report, time=now, episode=episode)
 
     def save_checkpoint(self):
         self.maddpg_agents.save_checkpoint()
+        if self.buffer_on_disk:
+            self.memory.save()
 
 if __name__ == '__main__':
+    import argparse
+    from tkinter import Tk
+    from gui import GUI
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--attach', help='host:port of a running `train.py --live` job to view')
+    parser.add_argument('--live-key', help='key of the live job (default: $MAAC_LIVE_AUTHKEY, else asked)')
+    args = parser.parse_args()
+    
     tk = Tk()
     gui = GUI(tk, Main())
+    if args.attach is not None:
+        gui.attach(args.attach, args.live_key)
     tk.mainloop()
\ No newline at end of file
@@ -5,24 +5,54 @@ import torch.nn.functional as F
 import torch.optim as optim
 import os
 
+def masked_logits(logits, mask):
+    # 불가능한 action (mask False)의 logit을 -inf로, softmax 후 확률 0
+    if mask is None:
+        return logits
+    return logits.masked_fill(~mask, float('-inf'))
+
+
+def head_parameters(network):
+    # encoder를 뺀 parameter: 공유 encoder는 네트워크마다가 아니라 encoder.optimizer로 한 번만 step
+    if network.encoder is None:
+        return list(network.parameters())
+    shared = set(map(id, network.encoder.parameters()))
+    return [param for param in network.parameters() if id(param) not in shared]
+
+
+def encoder_optimizer(encoder, lr):
+    # 같은 encoder를 쓰는 네트워크 중 처음 만들어진 것의 learning rate로 하나만 생성
+    if encoder is not None and not hasattr(encoder, 'optimizer'):
+        encoder.optimizer = optim.Adam(encoder.parameters(), lr=lr)
+
+
 class CriticNetwork(nn.Module):
     def __init__(self, beta, input_dims, fc1_dims, fc2_dims, 
-                    n_agents, n_actions, name, chkpt_dir):
+                    n_agents, n_actions, name, chkpt_dir, encoder=None, extra_dims=0):
         super(CriticNetwork, self).__init__()
 
         self.chkpt_file = os.path.join(chkpt_dir, name)
         os.makedirs(os.path.dirname(self.chkpt_file), exist_ok=True)
 
-        self.fc1 = nn.Linear(input_dims+n_agents*n_actions, fc1_dims)
+        # encoder (GridEncoder)가 있으면 에이전트별 관측을 인코딩한 feature를 이어 붙여 사용
+        self.n_agents = n_agents
+        self.encoder = encoder
+        if encoder is not None:
+            input_dims = n_agents * encoder.out_features
+
+        self.fc1 = nn.Linear(input_dims+extra_dims+n_agents*n_actions, fc1_dims)
         self.fc2 = nn.Linear(fc1_dims, fc2_dims)
         self.q = nn.Linear(fc2_dims, 1)
 
-        self.optimizer = optim.Adam(self.parameters(), lr=beta)
+        self.optimizer = optim.Adam(head_parameters(self), lr=beta)
+        encoder_optimizer(encoder, beta)
         self.device = T.device('cuda:0' if T.cuda.is_available() else 'cpu')
  
         self.to(self.device)
 
     def forward(self, state, action):
+        if self.encoder is not None:
+            state = self.encoder(state.view(state.shape[0], self.n_agents, -1)).flatten(1)
         x = F.relu(self.fc1(T.cat([state, action], dim=1)))
         x = F.relu(self.fc2(x))
         q = self.q(x)
@@ -38,25 +68,33 @@ class CriticNetwork(nn.Module):
 
 class ActorNetwork(nn.Module):
     def __init__(self, alpha, input_dims, fc1_dims, fc2_dims, 
-                 n_actions, name, chkpt_dir):
+                 n_actions, name, chkpt_dir, encoder=None, extra_dims=0):
         super(ActorNetwork, self).__init__()
 
         self.chkpt_file = os.path.join(chkpt_dir, name)
         os.makedirs(os.path.dirname(self.chkpt_file), exist_ok=True)
 
-        self.fc1 = nn.Linear(input_dims, fc1_dims)
+        self.encoder = encoder
+        if encoder is not None:
+            input_dims = encoder.out_features
+
+        self.fc1 = nn.Linear(input_dims+extra_dims, fc1_dims)
         self.fc2 = nn.Linear(fc1_dims, fc2_dims)
         self.pi = nn.Linear(fc2_dims, n_actions)
 
-        self.optimizer = optim.Adam(self.parameters(), lr=alpha)
+        self.optimizer = optim.Adam(head_parameters(self), lr=alpha)
+        encoder_optimizer(encoder, alpha)
         self.device = T.device('cuda:0' if T.cuda.is_available() else 'cpu')
  
         self.to(self.device)
 
-    def forward(self, state):
+    def forward(self, state, mask=None):
+        # mask: (batch, n_actions) bool, False인 action은 확률 0
+        if self.encoder is not None:
+            state = self.encoder(state)
         x = F.relu(self.fc1(state))
         x = F.relu(self.fc2(x))
-        pi = T.softmax(self.pi(x), dim=1)
+        pi = T.softmax(masked_logits(self.pi(x), mask), dim=1)
 
         return pi
 
@@ -66,3 +104,218 @@ class ActorNetwork(nn.Module):
     def load_checkpoint(self):
         self.load_state_dict(T.load(self.chkpt_file))
 
+
+class SharedCriticNetwork(CriticNetwork):
+    """One centralized critic for every agent, told which agent it scores by a
+    one-hot agent id appended to the state.
+
+    Same interface as CriticEnsemble: forward takes the shared state
+    (batch, input_dims) and per-agent actions (n_agents, batch, n_agents*n_actions)
+    and returns (n_agents, batch, 1), all agents as one batch.
+    """
+    def __init__(self, beta, input_dims, fc1_dims, fc2_dims,
+                    n_agents, n_actions, name, chkpt_dir, encoder=None):
+        super(SharedCriticNetwork, self).__init__(beta, input_dims, fc1_dims, fc2_dims, n_agents, n_actions,
+                                                  name, chkpt_dir, encoder=encoder, extra_dims=n_agents)
+        self.register_buffer('agent_ids', T.eye(n_agents, device=self.device))
+
+    def forward(self, state, action):
+        if self.encoder is not None:
+            state = self.encoder(state.view(state.shape[0], self.n_agents, -1)).flatten(1)
+        shape = (self.n_agents, state.shape[0])
+        x = T.cat([state.expand(*shape, state.shape[1]),
+                   self.agent_ids[:, None, :].expand(*shape, self.n_agents), action], dim=2)
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        q = self.q(x)
+
+        return q
+
+
+class SharedActorNetwork(ActorNetwork):
+    """One actor for every agent, conditioned on a one-hot agent id.
+
+    Same interface as ActorEnsemble: (n_agents, batch, input_dims) ->
+    (n_agents, batch, n_actions).
+    """
+    def __init__(self, alpha, input_dims, fc1_dims, fc2_dims,
+                 n_actions, n_agents, name, chkpt_dir, encoder=None):
+        super(SharedActorNetwork, self).__init__(alpha, input_dims, fc1_dims, fc2_dims, n_actions,
+                                                 name, chkpt_dir, encoder=encoder, extra_dims=n_agents)
+        self.n_agents = n_agents
+        self.register_buffer('agent_ids', T.eye(n_agents, device=self.device))
+
+    def forward(self, state, mask=None):
+        if self.encoder is not None:
+            state = self.encoder(state)
+        agent_ids = self.agent_ids[:, None, :].expand(self.n_agents, state.shape[1], self.n_agents)
+        x = F.relu(self.fc1(T.cat([state, agent_ids], dim=2)))
+        x = F.relu(self.fc2(x))
+        pi = T.softmax(masked_logits(self.pi(x), mask), dim=2)
+
+        return pi
+
+
+class GridEncoder(nn.Module):
+    """Small CNN over the map layers of a dense MAACEnv observation.
+
+    The self, other agents and dirty layers are reshaped back to (3, n_row, n_col),
+    run through two stride 2 3x3 convolutions and average pooled to pool x pool,
+    and the result is concatenated with the obstacle window. One instance is
+    shared by every agent's network of the same role, so its size does not
+    depend on the number of agents and only the pooled features reach the
+    heads. Takes (..., obs_dim), returns (..., out_features).
+    """
+    def __init__(self, n_row, n_col, visual_field=3, channels=16, pool=4):
+        super(GridEncoder, self).__init__()
+        self.n_row = n_row
+        self.n_col = n_col
+        self.vision_dims = visual_field**2
+
+        self.conv1 = nn.Conv2d(3, channels, 3, stride=2, padding=1)
+        self.conv2 = nn.Conv2d(channels, channels, 3, stride=2, padding=1)
+        self.pool = nn.AdaptiveAvgPool2d(pool)
+        self.out_features = self.vision_dims + channels * pool**2
+
+    def forward(self, obs):
+        shape = obs.shape[:-1]
+        obs = obs.reshape(-1, obs.shape[-1])
+        grid = obs[:, self.vision_dims:].reshape(-1, 3, self.n_row, self.n_col)
+        x = F.relu(self.conv1(grid))
+        x = F.relu(self.conv2(x))
+        x = self.pool(x).flatten(1)
+        return T.cat([obs[:, :self.vision_dims], x], dim=1).view(*shape, -1)
+
+
+class CompactEncoder(nn.Module):
+    """Front end for a compact MAACEnv observation (CompactObservationBuilder).
+
+    The coordinate, window and dirt map segments (sizes from the builder's
+    segments) are embedded by separate linear layers of embed_dims each and
+    concatenated, so the heads see one embedding per kind of input instead of
+    the raw mixed vector. Shared by every agent's network of the same role like
+    GridEncoder. Takes (..., obs_dim), returns (..., out_features).
+    """
+    def __init__(self, coord_dims, window_dims, map_dims, embed_dims=32):
+        super(CompactEncoder, self).__init__()
+        self.coord_dims = coord_dims
+        self.window_dims = window_dims
+
+        self.coords = nn.Linear(coord_dims, embed_dims)
+        self.window = nn.Linear(window_dims, embed_dims)
+        self.dirt_map = nn.Linear(map_dims, embed_dims)
+        self.out_features = 3 * embed_dims
+
+    def forward(self, obs):
+        map_offset = self.coord_dims + self.window_dims
+        return T.cat([F.relu(self.coords(obs[..., :self.coord_dims])),
+                      F.relu(self.window(obs[..., self.coord_dims:map_offset])),
+                      F.relu(self.dirt_map(obs[..., map_offset:]))], dim=-1)
+
+
+class EnsembleLinear(nn.Module):
+    """n_members independent nn.Linear layers evaluated with one batched matmul.
+
+    weight is stored as (n_members, in_features, out_features), i.e. the
+    transpose of each member's nn.Linear weight.
+    """
+    def __init__(self, n_members, in_features, out_features):
+        super(EnsembleLinear, self).__init__()
+        self.weight = nn.Parameter(T.empty(n_members, in_features, out_features))
+        self.bias = nn.Parameter(T.empty(n_members, 1, out_features))
+
+    def forward(self, x):
+        return T.baddbmm(self.bias, x, self.weight)
+
+    def load_members(self, linears):
+        with T.no_grad():
+            self.weight.copy_(T.stack([linear.weight.t() for linear in linears]))
+            self.bias.copy_(T.stack([linear.bias.unsqueeze(0) for linear in linears]))
+
+    def store_members(self, linears):
+        with T.no_grad():
+            for i, linear in enumerate(linears):
+                linear.weight.copy_(self.weight[i].t())
+                linear.bias.copy_(self.bias[i, 0])
+
+
+class CriticEnsemble(nn.Module):
+    """Every agent's CriticNetwork stacked into one module.
+
+    forward takes the shared state (batch, input_dims) and per-member actions
+    (n_members, batch, n_agents*n_actions) and returns (n_members, batch, 1).
+    """
+    def __init__(self, beta, critics):
+        super(CriticEnsemble, self).__init__()
+        self.members = critics
+        n_members = len(critics)
+        # encoder는 멤버끼리 같은 모듈을 공유하므로 그대로 사용
+        self.n_agents = critics[0].n_agents
+        self.encoder = critics[0].encoder
+
+        self.fc1 = EnsembleLinear(n_members, critics[0].fc1.in_features, critics[0].fc1.out_features)
+        self.fc2 = EnsembleLinear(n_members, critics[0].fc2.in_features, critics[0].fc2.out_features)
+        self.q = EnsembleLinear(n_members, critics[0].q.in_features, 1)
+        self.load_members()
+
+        self.optimizer = optim.Adam(head_parameters(self), lr=beta)
+        self.device = critics[0].device
+
+        self.to(self.device)
+
+    def forward(self, state, action):
+        if self.encoder is not None:
+            state = self.encoder(state.view(state.shape[0], self.n_agents, -1)).flatten(1)
+        state = state.expand(action.shape[0], *state.shape)
+        x = F.relu(self.fc1(T.cat([state, action], dim=2)))
+        x = F.relu(self.fc2(x))
+        q = self.q(x)
+
+        return q
+
+    def load_members(self):
+        for name in ('fc1', 'fc2', 'q'):
+            getattr(self, name).load_members([getattr(m, name) for m in self.members])
+
+    def store_members(self):
+        for name in ('fc1', 'fc2', 'q'):
+            getattr(self, name).store_members([getattr(m, name) for m in self.members])
+
+
+class ActorEnsemble(nn.Module):
+    """Every agent's ActorNetwork stacked into one module.
+
+    forward takes (n_members, batch, input_dims) and returns (n_members, batch, n_actions).
+    """
+    def __init__(self, alpha, actors):
+        super(ActorEnsemble, self).__init__()
+        self.members = actors
+        n_members = len(actors)
+        self.encoder = actors[0].encoder
+
+        self.fc1 = EnsembleLinear(n_members, actors[0].fc1.in_features, actors[0].fc1.out_features)
+        self.fc2 = EnsembleLinear(n_members, actors[0].fc2.in_features, actors[0].fc2.out_features)
+        self.pi = EnsembleLinear(n_members, actors[0].pi.in_features, actors[0].pi.out_features)
+        self.load_members()
+
+        self.optimizer = optim.Adam(head_parameters(self), lr=alpha)
+        self.device = actors[0].device
+
+        self.to(self.device)
+
+    def forward(self, state, mask=None):
+        if self.encoder is not None:
+            state = self.encoder(state)
+        x = F.relu(self.fc1(state))
+        x = F.relu(self.fc2(x))
+        pi = T.softmax(masked_logits(self.pi(x), mask), dim=2)
+
+        return pi
+
+    def load_members(self):
+        for name in ('fc1', 'fc2', 'pi'):
+            getattr(self, name).load_members([getattr(m, name) for m in self.members])
+
+    def store_members(self):
+        for name in ('fc1', 'fc2', 'pi'):
+            getattr(self, name).store_members([getattr(m, name) for m in self.members])
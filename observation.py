@@ -0,0 +1,240 @@
+import numpy as np
+
+
+class ObservationBuilder:
+    """Keeps every agent's observation in a preallocated (num_envs, n_agent, obs_dim)
+    buffer and patches only the cells touched by a step.
+
+    Layout of one observation (same as MAACEnv.get_observation):
+    [visual_field**2 obstacle window | self layer | other agents layer | dirty layer]
+
+    Two buffers are used in turn so the observation returned by the previous call
+    is still valid while the next one is built; the patch of the previous call is
+    replayed on the older buffer before the new one is applied.
+
+    obs[e] is C-contiguous, so obs[e].reshape(-1) is env e's global state
+    without a copy. float32 by default so it goes to torch as is.
+    """
+    binary = True
+
+    def __init__(self, obstacle_layer, n_agent, visual_field=3, dtype=np.float32):
+        self.num_envs, self.n_row, self.n_col = obstacle_layer.shape
+        self.n_agent = n_agent
+        self.visual_field = visual_field
+
+        self.padded_obstacle_layer = np.ones((self.num_envs, self.n_row+2, self.n_col+2), dtype=dtype)
+        self.padded_obstacle_layer[:, 1:-1, 1:-1] = obstacle_layer
+
+        n_cell = self.n_row * self.n_col
+        self.self_offset = visual_field**2
+        self.other_offset = self.self_offset + n_cell
+        self.dirty_offset = self.other_offset + n_cell
+        self.obs_dim = self.dirty_offset + n_cell
+
+        vf = visual_field // 2
+        self._offsets = np.arange(-vf, vf+1) + 1
+        self._agent_idx = np.arange(n_agent)[None, :]
+
+        self._buffers = np.zeros((2, self.num_envs, n_agent, self.obs_dim), dtype=dtype)
+        self._cur = 0
+        self._pending = None
+
+    @property
+    def obs(self):
+        return self._buffers[self._cur]
+
+    def reset(self, agent_pos, dirty_layer, env_ids=None):
+        if env_ids is None:
+            env_ids = np.arange(self.num_envs)
+        env_ids = np.asarray(env_ids)
+        pos = agent_pos[env_ids]
+        flat = self._flat(pos)
+        e = np.arange(len(env_ids))[:, None]
+        n_cell = self.n_row * self.n_col
+
+        obs = np.zeros((len(env_ids), self.n_agent, self.obs_dim), dtype=self._buffers.dtype)
+        obs[..., :self.self_offset] = self._vision(env_ids[:, None], pos)
+        obs[e, self._agent_idx, self.self_offset + flat] = 1
+
+        occupied = np.zeros((len(env_ids), n_cell), dtype=obs.dtype)
+        occupied[e, flat] = 1
+        obs[..., self.other_offset:self.dirty_offset] = occupied[:, None, :]
+        obs[e, self._agent_idx, self.other_offset + flat] = 0
+
+        obs[..., self.dirty_offset:] = dirty_layer[env_ids].reshape(len(env_ids), 1, n_cell)
+
+        self._buffers[:, env_ids] = obs
+        if self._pending is not None:
+            moved, pos, new_pos, cleaned_env, cleaned_cell = self._pending
+            moved[env_ids] = False
+            keep = ~np.isin(cleaned_env, env_ids)
+            self._pending = (moved, pos, new_pos, cleaned_env[keep], cleaned_cell[keep])
+        return self.obs
+
+    def update(self, pos, new_pos, cleaned_env, cleaned_cell):
+        """pos/new_pos: (num_envs, n_agent, 2) positions before and after the step,
+        cleaned_env/cleaned_cell: env index and flat cell index of every cleaned cell."""
+        patch = ((pos != new_pos).any(axis=2), pos.copy(), new_pos.copy(),
+                 np.asarray(cleaned_env, dtype=np.int64), np.asarray(cleaned_cell, dtype=np.int64))
+
+        self._cur = 1 - self._cur
+        if self._pending is not None:
+            self._apply(self._buffers[self._cur], *self._pending)
+        self._apply(self._buffers[self._cur], *patch)
+        self._pending = patch
+        return self.obs
+
+    def _apply(self, obs, moved, pos, new_pos, cleaned_env, cleaned_cell):
+        e, a = np.nonzero(moved)
+        if len(e):
+            old_flat = self._flat(pos[e, a])
+            new_flat = self._flat(new_pos[e, a])
+            obs[e, a, :self.self_offset] = self._vision(e, new_pos[e, a])
+            obs[e, a, self.self_offset + old_flat] = 0
+            obs[e, a, self.self_offset + new_flat] = 1
+            obs[e[:, None], self._agent_idx, (self.other_offset + old_flat)[:, None]] = 0
+            obs[e[:, None], self._agent_idx, (self.other_offset + new_flat)[:, None]] = 1
+            obs[e, a, self.other_offset + new_flat] = 0
+        if len(cleaned_env):
+            obs[cleaned_env[:, None], self._agent_idx, (self.dirty_offset + cleaned_cell)[:, None]] = 0
+
+    def _vision(self, env_idx, pos):
+        rows = pos[..., 0, None, None] + self._offsets[:, None]
+        cols = pos[..., 1, None, None] + self._offsets[None, :]
+        vision = self.padded_obstacle_layer[env_idx[..., None, None], rows, cols]
+        return vision.reshape(pos.shape[:-1] + (self.visual_field**2,))
+
+    def _flat(self, pos):
+        return pos[..., 0] * self.n_col + pos[..., 1]
+
+
+class CompactObservationBuilder:
+    """Observation whose size does not grow with the map, same interface as
+    ObservationBuilder.
+
+    Layout of one observation:
+    [self row, col | other agents' row, col ... | k*k obstacle window |
+     k*k other agents window | k*k dirty window | dirt map]
+
+    Coordinates are scaled to [0, 1]. Windows (odd k) are centred on the agent; outside
+    the map counts as obstacle. The dirt map splits the grid into
+    min(dirt_map, n_row) x min(dirt_map, n_col) blocks and holds the fraction of
+    each block still dirty. obs_dim = 2*n_agent + 3*window**2 + dirt_map**2 at most.
+
+    Obstacle, occupancy and dirty maps are kept padded and updated in place, and
+    the per-block dirt counts are decremented per cleaned cell, so a step costs
+    O(n_agent * (n_agent + window**2) + dirt_map**2) per env. Uses two buffers
+    in turn like ObservationBuilder.
+    """
+    binary = False
+
+    def __init__(self, obstacle_layer, n_agent, window=5, dirt_map=8, dtype=np.float32):
+        if window % 2 == 0:
+            raise ValueError('window must be odd')
+        self.num_envs, self.n_row, self.n_col = obstacle_layer.shape
+        self.n_agent = n_agent
+        self.window = window
+        half = window // 2
+        self.half = half
+
+        padded_shape = (self.num_envs, self.n_row + 2*half, self.n_col + 2*half)
+        # 0/1 (에이전트 수) layer라서 uint8, 큰 맵에서도 칸당 3 byte
+        self.padded_obstacle_layer = np.ones(padded_shape, dtype=np.uint8)
+        self.padded_obstacle_layer[:, half:half+self.n_row, half:half+self.n_col] = obstacle_layer
+        self.padded_agent_layer = np.zeros(padded_shape, dtype=np.uint8)
+        self.padded_dirty_layer = np.zeros(padded_shape, dtype=np.uint8)
+
+        # 각 칸이 속한 dirt map block과 block별 칸 수
+        map_rows, map_cols = min(dirt_map, self.n_row), min(dirt_map, self.n_col)
+        row_edges = np.linspace(0, self.n_row, map_rows + 1).astype(np.int64)
+        col_edges = np.linspace(0, self.n_col, map_cols + 1).astype(np.int64)
+        self.row_starts, self.col_starts = row_edges[:-1], col_edges[:-1]
+        self.row_block = np.repeat(np.arange(map_rows), np.diff(row_edges))
+        self.col_block = np.repeat(np.arange(map_cols), np.diff(col_edges))
+        self.block_size = np.outer(np.diff(row_edges), np.diff(col_edges)).astype(dtype)
+        self.dirt_count = np.zeros((self.num_envs, map_rows, map_cols), dtype=dtype)
+
+        self.other_offset = 2 * n_agent
+        self.window_offset = self.other_offset
+        self.map_offset = self.window_offset + 3 * window**2
+        self.obs_dim = self.map_offset + map_rows * map_cols
+
+        self._scale = np.array([max(self.n_row - 1, 1), max(self.n_col - 1, 1)], dtype=dtype)
+        # 에이전트 i의 좌표 순서: 자기 자신, 나머지 에이전트
+        self._order = np.array([[i] + [j for j in range(n_agent) if j != i] for i in range(n_agent)])
+        offsets = np.arange(window)
+        self._window_rows = offsets[:, None]
+        self._window_cols = offsets[None, :]
+
+        self._buffers = np.zeros((2, self.num_envs, n_agent, self.obs_dim), dtype=dtype)
+        self._cur = 0
+        self._pos = np.zeros((self.num_envs, n_agent, 2), dtype=np.int64)
+
+    @property
+    def obs(self):
+        return self._buffers[self._cur]
+
+    @property
+    def segments(self):
+        # (좌표, window 3개, dirt map) 구간의 크기, networks.CompactEncoder 인자
+        return self.window_offset, self.map_offset - self.window_offset, self.obs_dim - self.map_offset
+
+    def reset(self, agent_pos, dirty_layer, env_ids=None):
+        if env_ids is None:
+            env_ids = np.arange(self.num_envs)
+        env_ids = np.asarray(env_ids)
+        half = self.half
+        inner = (slice(half, half + self.n_row), slice(half, half + self.n_col))
+
+        self._pos[env_ids] = agent_pos[env_ids]
+        self.padded_agent_layer[env_ids] = 0
+        np.add.at(self.padded_agent_layer,
+                  (env_ids[:, None], self._pos[env_ids, :, 0] + half, self._pos[env_ids, :, 1] + half), 1)
+        dirty = dirty_layer[env_ids]
+        self.padded_dirty_layer[(env_ids,) + inner] = dirty
+        self.dirt_count[env_ids] = np.add.reduceat(
+            np.add.reduceat(dirty, self.row_starts, axis=1, dtype=self.dirt_count.dtype),
+            self.col_starts, axis=2)
+
+        for buffer in self._buffers:
+            self._build(buffer, env_ids)
+        return self.obs
+
+    def update(self, pos, new_pos, cleaned_env, cleaned_cell):
+        """Same arguments as ObservationBuilder.update."""
+        half = self.half
+        e = np.arange(self.num_envs)[:, None]
+        np.subtract.at(self.padded_agent_layer, (e, pos[..., 0] + half, pos[..., 1] + half), 1)
+        np.add.at(self.padded_agent_layer, (e, new_pos[..., 0] + half, new_pos[..., 1] + half), 1)
+        self._pos[:] = new_pos
+
+        cleaned_env = np.asarray(cleaned_env, dtype=np.int64)
+        cleaned_cell = np.asarray(cleaned_cell, dtype=np.int64)
+        if len(cleaned_env):
+            rows, cols = np.divmod(cleaned_cell, self.n_col)
+            self.padded_dirty_layer[cleaned_env, rows + half, cols + half] = 0
+            np.subtract.at(self.dirt_count, (cleaned_env, self.row_block[rows], self.col_block[cols]), 1)
+
+        self._cur = 1 - self._cur
+        self._build(self._buffers[self._cur], np.arange(self.num_envs))
+        return self.obs
+
+    def _build(self, obs, env_ids):
+        pos = self._pos[env_ids]
+        coords = pos / self._scale
+        obs[env_ids, :, :self.other_offset] = coords[:, self._order].reshape(len(env_ids), self.n_agent, -1)
+
+        # padded 좌표에서 (row, col)이 window의 중앙이 되도록
+        rows = pos[..., 0, None, None] + self._window_rows
+        cols = pos[..., 1, None, None] + self._window_cols
+        env = env_ids[:, None, None, None]
+        k2 = self.window**2
+        windows = obs[env_ids, :, self.window_offset:self.map_offset].reshape(len(env_ids), self.n_agent, 3, k2)
+        windows[:, :, 0] = self.padded_obstacle_layer[env, rows, cols].reshape(len(env_ids), self.n_agent, k2)
+        windows[:, :, 1] = self.padded_agent_layer[env, rows, cols].reshape(len(env_ids), self.n_agent, k2)
+        windows[:, :, 1, k2 // 2] -= 1 # 자기 자신은 제외
+        windows[:, :, 2] = self.padded_dirty_layer[env, rows, cols].reshape(len(env_ids), self.n_agent, k2)
+        obs[env_ids, :, self.window_offset:self.map_offset] = windows.reshape(len(env_ids), self.n_agent, -1)
+
+        dirt_map = (self.dirt_count[env_ids] / self.block_size).reshape(len(env_ids), 1, -1)
+        obs[env_ids, :, self.map_offset:] = dirt_map
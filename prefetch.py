@@ -0,0 +1,136 @@
+import threading
+import time
+from queue import Queue
+
+import numpy as np
+import torch as T
+
+
+def sample_tensors(memory, device):
+    """Sample a batch from a replay buffer as tensors on device:
+    (states, actions, rewards, states_, dones, batch, weights)
+
+    actions is (batch_size, n_agents, n_actions); actor states are slices of
+    states. batch and weights are None for uniform replay.
+    """
+    return to_tensors(device, *sample_arrays(memory))
+
+
+def sample_arrays(memory):
+    # (samples, batch, weights) as numpy, see sample_tensors
+    if memory.prioritized:
+        return memory.sample_prioritized()
+    return memory.sample_buffer(), None, None
+
+
+def to_tensors(device, samples, batch, weights):
+    _, states, actions, rewards, _, states_, dones = samples
+
+    states = T.tensor(states, dtype=T.float).to(device)
+    actions = T.tensor(np.stack(actions, axis=1), dtype=T.float).to(device)
+    rewards = T.tensor(rewards, dtype=T.float).to(device)
+    states_ = T.tensor(states_, dtype=T.float).to(device)
+    dones = T.tensor(dones).to(device)
+    if weights is not None:
+        weights = T.tensor(weights, dtype=T.float).to(device)
+
+    return states, actions, rewards, states_, dones, batch, weights
+
+
+class BatchPrefetcher:
+    """Wraps a replay buffer and samples the next batches on a worker thread.
+
+    Batches are gathered by the buffer's sample_into straight into `depth`
+    preallocated tensor slots (pinned when the learner is on CUDA), so get()
+    hands the learner ready-to-use tensors. A slot is reused once the batch after
+    it has been taken. Everything else is forwarded to the wrapped buffer;
+    store_transition(s) and update_priorities take the same lock as sampling.
+    """
+    prefetched = True
+
+    def __init__(self, memory, device, depth=2):
+        self.memory = memory
+        self.device = T.device(device)
+        self.lock = threading.Lock()
+
+        pin = self.device.type == 'cuda'
+        batch_size, n_agents = memory.batch_size, memory.n_agents
+        self.slots = []
+        for _ in range(depth):
+            self.slots.append({
+                'states': T.empty((batch_size, memory.critic_dims), pin_memory=pin),
+                'actions': T.empty((batch_size, n_agents, memory.n_actions), pin_memory=pin),
+                'rewards': T.empty((batch_size, n_agents), pin_memory=pin),
+                'states_': T.empty((batch_size, memory.critic_dims), pin_memory=pin),
+                'dones': T.empty((batch_size, n_agents), dtype=T.bool, pin_memory=pin),
+                'weights': T.empty((batch_size,), pin_memory=pin),
+                'batch': None,
+            })
+            # 버퍼가 sample_into로 바로 쓰는 numpy view
+            self.slots[-1]['arrays'] = {name: self.slots[-1][name].numpy() for name in
+                                        ('states', 'actions', 'rewards', 'states_', 'dones', 'weights')}
+
+        self.free = Queue()
+        self.filled = Queue()
+        for slot in range(depth):
+            self.free.put(slot)
+        self.in_use = None
+        self.error = None
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.memory, name)
+
+    def store_transition(self, *args, **kwargs):
+        with self.lock:
+            self.memory.store_transition(*args, **kwargs)
+
+    def store_transitions(self, *args, **kwargs):
+        with self.lock:
+            self.memory.store_transitions(*args, **kwargs)
+
+    def update_priorities(self, batch, td_errors):
+        with self.lock:
+            self.memory.update_priorities(batch, td_errors)
+
+    def run(self):
+        try:
+            while self.running:
+                if not self.memory.ready():
+                    time.sleep(0.01)
+                    continue
+                slot = self.free.get()
+                if slot is None:
+                    return
+                self.fill(self.slots[slot])
+                self.filled.put(slot)
+        except Exception as e:
+            self.error = e
+            self.filled.put(None)
+
+    def fill(self, slot):
+        with self.lock:
+            slot['batch'] = self.memory.sample_into(slot['arrays'])
+
+    def get(self):
+        if self.in_use is not None:
+            self.free.put(self.in_use)
+        self.in_use = self.filled.get()
+        if self.in_use is None:
+            raise self.error
+
+        slot = self.slots[self.in_use]
+        tensors = tuple(slot[name].to(self.device, non_blocking=True)
+                        for name in ('states', 'actions', 'rewards', 'states_', 'dones'))
+        weights = None
+        if slot['batch'] is not None:
+            weights = slot['weights'].to(self.device, non_blocking=True)
+        return tensors + (slot['batch'], weights)
+
+    def close(self):
+        self.running = False
+        self.free.put(None)
+        self.thread.join()
@@ -0,0 +1,160 @@
+import cProfile
+import csv
+import json
+import os
+import time
+
+import torch as T
+
+
+class _Phase:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.timer.cuda_sync:
+            T.cuda.synchronize()
+        self.timer.add(self.name, time.perf_counter() - self.start)
+
+
+class _NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class PhaseTimer:
+    """Accumulates wall time per named phase and counts events between reports.
+
+        with timer('env.step'):
+            env.step(actions)
+        timer.count('env_steps')
+
+    Nested phases are named with '/' (e.g. 'learn/backward'); their time is also
+    part of the parent's. When disabled every call is a shared no-op. With
+    cuda_sync, each phase waits for queued CUDA work so GPU time lands in the
+    phase that launched it. Counters listed in `counters` (and any counter once
+    seen) are reported even when they stay at 0.
+    """
+    def __init__(self, enabled=True, cuda_sync=False, counters=()):
+        self.enabled = enabled
+        self.cuda_sync = cuda_sync and T.cuda.is_available()
+        self.phases = {}
+        self.counters = dict.fromkeys(counters, 0)
+        self.reset()
+
+    def __call__(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = _Phase(self, name)
+        return phase
+
+    def add(self, name, seconds):
+        total = self.totals.get(name)
+        if total is None:
+            self.totals[name] = [seconds, 1]
+        else:
+            total[0] += seconds
+            total[1] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        self.totals = {}
+        self.counters = dict.fromkeys(self.counters, 0)
+        self.start = time.perf_counter()
+
+    def report(self, reset=True):
+        """{'wall': s, '<counter>_per_sec': ..., 'phases': {name: {seconds, calls, share}}}"""
+        wall = max(time.perf_counter() - self.start, 1e-9)
+        record = {'wall': wall}
+        for name, n in sorted(self.counters.items()):
+            record[name + '_per_sec'] = n / wall
+        record['phases'] = {name: {'seconds': seconds, 'calls': calls, 'share': seconds / wall}
+                            for name, (seconds, calls) in sorted(self.totals.items())}
+        if reset:
+            self.reset()
+        return record
+
+
+def write_report(path, record, **extra):
+    """Appends a PhaseTimer.report() to path: json lines, or long-format rows
+    (one per phase) when path ends with .csv."""
+    if not path.endswith('.csv'):
+        with open(path, 'a') as f:
+            f.write(json.dumps(dict(extra, **record)) + '\n')
+        return
+
+    rates = {name: value for name, value in record.items() if name.endswith('_per_sec')}
+    header = list(extra) + ['wall'] + sorted(rates) + ['phase', 'seconds', 'calls', 'share']
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+        for phase, stats in record['phases'].items():
+            writer.writerow(dict(extra, wall=record['wall'], phase=phase, **rates, **stats))
+
+
+def summary(record, top=5):
+    rates = ', '.join('{} {:.0f}'.format(name, value) for name, value in record.items()
+                      if name.endswith('_per_sec'))
+    # 최상위 phase만 (하위 phase는 부모 시간에 포함)
+    phases = sorted(((stats['share'], name) for name, stats in record['phases'].items() if '/' not in name),
+                    reverse=True)[:top]
+    return rates + ' | ' + ', '.join('{} {:.0%}'.format(name, share) for share, name in phases)
+
+
+class CaptureWindow:
+    """Runs torch.profiler (torch.autograd.profiler on old torch) or cProfile
+    for episodes [start_episode, start_episode + n_episodes) and writes the
+    result next to path: path.json (chrome trace) and path.txt for torch,
+    path.prof for cProfile."""
+    def __init__(self, start_episode, n_episodes=1, tool='torch', path='profile'):
+        self.start_episode = start_episode
+        self.stop_episode = start_episode + n_episodes
+        self.tool = tool
+        self.path = path
+        self.profiler = None
+
+    def episode_start(self, episode):
+        if episode != self.start_episode:
+            return
+        if self.tool == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif hasattr(T, 'profiler') and hasattr(T.profiler, 'profile'):
+            self.profiler = T.profiler.profile()
+            self.profiler.__enter__()
+        else:
+            self.profiler = T.autograd.profiler.profile()
+            self.profiler.__enter__()
+
+    def episode_end(self, episode, force=False):
+        if self.profiler is None or (episode + 1 < self.stop_episode and not force):
+            return
+        if self.tool == 'cprofile':
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path + '.prof')
+        else:
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(self.path + '.json')
+            with open(self.path + '.txt', 'w') as f:
+                f.write(self.profiler.key_averages().table(sort_by='self_cpu_time_total', row_limit=50))
+        print('profile written to', self.path)
+        self.profiler = None
@@ -0,0 +1,113 @@
+import threading
+from queue import Empty, Queue
+
+import numpy as np
+
+from bitboard import BitLayer
+
+
+class FrameStream:
+    """Bounded queue of frame diffs from the training thread to a viewer.
+
+    push() only records the cells whose visited/dirty value changed since the
+    last frame that made it into the queue, plus the agent positions. Between
+    pushes of consecutive steps of an episode only the cells the agents moved to
+    are compared (an env step changes nothing else); after a new episode or
+    skipped steps the whole grid is. When the queue is full the frame is
+    dropped (and the next diff covers it), so pushing never blocks training.
+    The viewer takes everything queued with pop() and merges it into one update.
+    """
+    def __init__(self, n_row, n_col, max_frames=4):
+        self.frames = Queue(maxsize=max_frames)
+        self.n_col = n_col
+        self.visited_layer = np.empty((n_row, n_col))
+        self.dirty_layer = np.empty((n_row, n_col))
+        # 마지막 push의 (episode, steps), 그 뒤로 아직 보내지 않은 에이전트 도착 칸
+        self.last_step = None
+        self.pending = []
+        self.compare_all = True
+        # resync는 뷰어 쪽 thread (reset)와 학습 thread (push)가 같이 씀
+        self.lock = threading.Lock()
+        self.resync = True
+        self.watching = True
+
+    def push(self, episode, steps, agents_info, visited_layer, dirty_layer, **kwargs):
+        agent_pos = [agent.get('new_pos', agent['pos']) for agent in agents_info.values()]
+        with self.lock:
+            if self.last_step == (episode, steps - 1):
+                self.pending.extend(agent_pos)
+            else:
+                self.compare_all = True
+            self.last_step = (episode, steps)
+
+            # only the training thread puts, so a non-full queue stays non-full here
+            if self.frames.full():
+                return False
+
+            if self.resync or self.compare_all:
+                # grid='bits' env의 BitLayer도 받음
+                visited_layer, dirty_layer = np.asarray(visited_layer), np.asarray(dirty_layer)
+                if self.resync:
+                    cells = np.arange(visited_layer.size)
+                else:
+                    cells = np.flatnonzero((visited_layer != self.visited_layer) |
+                                           (dirty_layer != self.dirty_layer))
+                visited = visited_layer.flat[cells]
+                dirty = dirty_layer.flat[cells]
+            else:
+                rows, cols = np.array(self.pending, dtype=np.int64).reshape(-1, 2).T
+                cells = np.unique(rows * self.n_col + cols)
+                rows, cols = np.divmod(cells, self.n_col)
+                visited = visited_layer[rows, cols]
+                dirty = dirty_layer[rows, cols]
+                if isinstance(dirty_layer, BitLayer):
+                    dirty = dirty.astype(np.uint8) # np.asarray(BitLayer)와 같게
+                changed = (visited != self.visited_layer.flat[cells]) | (dirty != self.dirty_layer.flat[cells])
+                cells, visited, dirty = cells[changed], visited[changed], dirty[changed]
+            self.visited_layer.flat[cells] = visited
+            self.dirty_layer.flat[cells] = dirty
+            self.resync = self.compare_all = False
+            self.pending = []
+
+            self.frames.put_nowait({
+                'episode': episode,
+                'steps': steps,
+                'agent_pos': agent_pos,
+                'cells': cells,
+                'visited': visited,
+                'dirty': dirty,
+            })
+        return True
+
+    def pop(self):
+        """Merges every queued frame; returns None if there is none."""
+        frames = []
+        while True:
+            try:
+                frames.append(self.frames.get_nowait())
+            except Empty:
+                return merge_frames(frames)
+
+    def reset(self):
+        # called from the viewer side; the next push sends every cell again
+        with self.lock:
+            while True:
+                try:
+                    self.frames.get_nowait()
+                except Empty:
+                    break
+            self.resync = True
+
+
+def merge_frames(frames):
+    """One frame equivalent to applying frames in order (None if empty)."""
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    # newest value of every cell
+    cells = np.concatenate([frame['cells'] for frame in frames[::-1]])
+    visited = np.concatenate([frame['visited'] for frame in frames[::-1]])
+    dirty = np.concatenate([frame['dirty'] for frame in frames[::-1]])
+    cells, last = np.unique(cells, return_index=True)
+    return dict(frames[-1], cells=cells, visited=visited[last], dirty=dirty[last])
@@ -0,0 +1,79 @@
+"""Replays episodes recorded with Main.record_dir / train.py --record.
+
+    python replay.py runs/record                      # list recorded episodes
+    python replay.py runs/record --episode 300        # GUI player
+    python replay.py runs/record --episode 300 --text --speed 20 --start 40
+"""
+import argparse
+import time
+
+import numpy as np
+
+from trajectory import TrajectoryReader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='replay recorded episodes')
+    parser.add_argument('directory')
+    parser.add_argument('--episode', type=int, help='episode to play (default: list episodes)')
+    parser.add_argument('--text', action='store_true', help='play in the terminal instead of the GUI')
+    parser.add_argument('--speed', type=float, default=10, help='steps per second, 0 for no delay')
+    parser.add_argument('--start', type=int, default=0, help='step to start from')
+    return parser.parse_args()
+
+
+def list_episodes(reader):
+    print('{} episodes in {}'.format(len(reader), reader.directory))
+    for episode in reader.episodes:
+        trajectory = reader[episode]
+        print('episode {:>6}: {:>4} steps, score {:>7.1f}, {:>4} cells cleaned'.format(
+            episode, len(trajectory) - 1, trajectory.score, len(trajectory.cleaned)))
+
+
+def draw_text(scenario, frame):
+    n_row, n_col = scenario['n_row'], scenario['n_col']
+    grid = np.full((n_row, n_col), ' ')
+    grid[frame['dirty'].reshape(n_row, n_col) == 1] = '.'
+    for row, col in scenario['obstacles']:
+        grid[row, col] = '#'
+    for i, (row, col) in enumerate(frame['agent_pos']):
+        grid[row, col] = str(i % 10)
+    lines = ['episode {}, step {}'.format(frame['episode'], frame['steps'])]
+    lines += ['|' + ''.join(row) + '|' for row in grid]
+    return '\n'.join(lines)
+
+
+def play_text(reader, episode, speed, start):
+    trajectory = reader[episode]
+    for t in range(start, len(trajectory)):
+        # 화면 지우고 커서를 맨 위로
+        print('\033[2J\033[H' + draw_text(reader.scenario, trajectory.frame(t)), flush=True)
+        if speed > 0:
+            time.sleep(1 / speed)
+    print('score {:.1f}'.format(trajectory.score))
+
+
+def main():
+    args = parse_args()
+    reader = TrajectoryReader(args.directory)
+
+    if args.episode is None:
+        list_episodes(reader)
+    elif args.text:
+        play_text(reader, args.episode, args.speed, args.start)
+    else:
+        from tkinter import Tk
+        from gui import GUI
+        from main import Main
+
+        tk = Tk()
+        gui = GUI(tk, Main())
+        gui.open_trajectory(args.directory, args.episode, speed=max(int(args.speed), 1))
+        if args.start:
+            gui.step_scale.set(args.start)
+            gui.show_step(args.start)
+        tk.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import copy
+import os
+import queue
+import tempfile
+import time
+
+import numpy as np
+import torch as T
+import torch.multiprocessing as mp
+
+from networks import ActorNetwork, ActorEnsemble, SharedActorNetwork, CompactEncoder, GridEncoder
+
+
+class TransitionRing:
+    """Single-producer/single-consumer ring of transitions in shared memory.
+
+    A rollout worker writes records and advances write_cntr; the learner copies
+    out everything up to write_cntr and advances read_cntr. The worker waits
+    while the ring is full.
+    """
+    def __init__(self, ctx, capacity, critic_dims, n_agents, n_actions):
+        self.capacity = capacity
+        self.record_dtype = np.dtype([
+            ('state', np.float32, (critic_dims,)),
+            ('new_state', np.float32, (critic_dims,)),
+            ('action', np.float32, (n_agents, n_actions)),
+            ('reward', np.float32, (n_agents,)),
+            ('terminal', np.bool_, (n_agents,)),
+        ])
+        self.raw = ctx.RawArray('b', capacity * self.record_dtype.itemsize)
+        self.write_cntr = ctx.RawValue('q', 0)
+        self.read_cntr = ctx.RawValue('q', 0)
+        self.records = np.frombuffer(self.raw, dtype=self.record_dtype)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['records']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.records = np.frombuffer(self.raw, dtype=self.record_dtype)
+
+    def put(self, state, action, reward, state_, done, stop):
+        while self.write_cntr.value - self.read_cntr.value >= self.capacity:
+            if stop.is_set():
+                return
+            time.sleep(0.001)
+
+        record = self.records[self.write_cntr.value % self.capacity]
+        record['state'] = state
+        record['new_state'] = state_
+        record['action'] = action
+        record['reward'] = reward
+        record['terminal'] = done
+        self.write_cntr.value += 1
+
+    def drain(self):
+        start, end = self.read_cntr.value, self.write_cntr.value
+        records = self.records[np.arange(start, end) % self.capacity]
+        self.read_cntr.value = end
+        return records
+
+
+def rollout_worker(worker_id, env, weights, version, lock, ring, episodes, stop,
+                   max_steps, seed, action_mask=False, episodes_left=None):
+    # rollout workers act on CPU, one thread each
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    T.set_num_threads(1)
+    np.random.seed(seed)
+    T.manual_seed(seed)
+
+    encoder = None
+    if 'encoder.conv1.weight' in weights:
+        encoder = GridEncoder(env.n_row, env.n_col, env.visual_field,
+                              channels=weights['encoder.conv1.weight'].shape[0])
+    elif 'encoder.coords.weight' in weights:
+        encoder = CompactEncoder(*env.observer.segments, embed_dims=weights['encoder.coords.weight'].shape[0])
+    if 'agent_ids' in weights:
+        # MADDPG(shared=True): 하나의 SharedActorNetwork
+        n_agents = weights['agent_ids'].shape[0]
+        fc1_dims, input_dims = weights['fc1.weight'].shape
+        n_actions = weights['pi.weight'].shape[0]
+        actor = SharedActorNetwork(0.0, input_dims - n_agents, fc1_dims, weights['fc2.weight'].shape[0],
+                                   n_actions, n_agents, name='rollout_actor',
+                                   chkpt_dir=tempfile.gettempdir(), encoder=encoder)
+    else:
+        n_agents, input_dims, fc1_dims = weights['fc1.weight'].shape
+        fc2_dims = weights['fc2.weight'].shape[2]
+        n_actions = weights['pi.weight'].shape[2]
+        actors = [ActorNetwork(0.0, input_dims, fc1_dims, fc2_dims, n_actions,
+                               name='rollout_actor', chkpt_dir=tempfile.gettempdir(), encoder=encoder)
+                  for _ in range(n_agents)]
+        actor = ActorEnsemble(0.0, actors)
+    local_version = -1
+
+    while not stop.is_set():
+        # 남은 에피소드 수 (음수면 제한 없음)에서 하나를 받아 가고, 다 받아 갔으면 종료
+        if episodes_left is not None:
+            with episodes_left.get_lock():
+                if episodes_left.value == 0:
+                    break
+                if episodes_left.value > 0:
+                    episodes_left.value -= 1
+
+        if version.value != local_version:
+            with lock:
+                actor.load_state_dict(weights)
+                local_version = version.value
+
+        obs = env.reset()
+        score = 0
+        done = [False]*n_agents
+        episode_step = 0
+        while not any(done) and not stop.is_set():
+            with T.no_grad():
+                state = T.as_tensor(np.asarray(obs, dtype=np.float32)[:, None, :])
+                if action_mask:
+                    # MADDPG.choose_action(obs, mask)와 같음
+                    mask = T.as_tensor(env.get_action_mask())
+                    actions = actor.forward(state, mask[:, None, :])[:, 0]
+                    actions = ((actions + T.rand(actions.shape)) * mask).numpy()
+                else:
+                    actions = actor.forward(state)[:, 0]
+                    actions = (actions + T.rand(actions.shape)).numpy()
+            obs_, reward, done, info = env.step(actions)
+
+            if episode_step >= max_steps:
+                done = [True]*n_agents
+
+            ring.put(np.reshape(obs, -1), actions, reward, np.reshape(obs_, -1), done, stop)
+
+            obs = obs_
+            score += sum(reward)
+            episode_step += 1
+
+        episodes.put((worker_id, score, episode_step))
+
+
+class ParallelRollout:
+    """Distributed actor-learner loop.
+
+    n_workers processes each run a copy of env and a CPU copy of the actors and
+    stream transitions into the learner's replay buffer through shared-memory
+    rings. The learner calls MADDPG.learn every learn_every transitions and
+    broadcasts the actor weights to the workers every broadcast_every learn steps.
+    With action_mask the workers only pick moves allowed by env.get_action_mask().
+    With max_episodes the workers start exactly that many episodes in total and
+    then exit, so score_history never grows past it.
+    """
+    def __init__(self, env, maddpg, memory, n_workers=2, ring_size=4096,
+                 learn_every=100, broadcast_every=1, max_steps=100, seed=0, action_mask=False,
+                 max_episodes=None):
+        if maddpg.inference_actor is None:
+            raise ValueError('parallel rollout needs every agent to have the same actor_dims')
+
+        # workers get a pickled copy of the env, without the GUI callback
+        self.env = copy.copy(env)
+        self.env.render_callback = None
+        self.maddpg = maddpg
+        self.memory = memory
+        self.n_workers = n_workers
+        self.learn_every = learn_every
+        self.broadcast_every = broadcast_every
+        self.max_steps = max_steps
+        self.seed = seed
+        self.action_mask = action_mask
+
+        self.ctx = mp.get_context('spawn')
+        self.weights = {name: param.detach().cpu().clone().share_memory_()
+                        for name, param in maddpg.inference_actor.state_dict().items()}
+        self.version = self.ctx.Value('q', 0)
+        self.lock = self.ctx.Lock()
+        self.stop = self.ctx.Event()
+        self.episodes = self.ctx.Queue()
+        self.episodes_left = self.ctx.Value('q', -1 if max_episodes is None else max_episodes)
+        self.rings = [TransitionRing(self.ctx, ring_size, memory.critic_dims,
+                                     maddpg.n_agents, maddpg.n_actions)
+                      for _ in range(n_workers)]
+        self.workers = []
+
+        self.total_steps = 0
+        self.learn_steps = 0
+        self.pending = 0
+        self.score_history = []
+        self.force_stop = False
+
+    def start(self):
+        self.stop.clear()
+        for worker_id, ring in enumerate(self.rings):
+            worker = self.ctx.Process(target=rollout_worker, daemon=True, args=(
+                worker_id, self.env, self.weights, self.version, self.lock, ring,
+                self.episodes, self.stop, self.max_steps, self.seed + worker_id, self.action_mask,
+                self.episodes_left))
+            worker.start()
+            self.workers.append(worker)
+
+    def broadcast(self):
+        with self.lock:
+            for name, param in self.maddpg.inference_actor.state_dict().items():
+                self.weights[name].copy_(param)
+            self.version.value += 1
+
+    def drain(self):
+        # 끝난 에피소드를 먼저 받고 ring을 비움: worker는 transition을 다 넣은 뒤에 에피소드를
+        # 알리므로, score_history에 들어간 에피소드의 transition은 모두 buffer에 들어가 있음
+        while True:
+            try:
+                worker_id, score, steps = self.episodes.get_nowait()
+            except queue.Empty:
+                break
+            self.score_history.append(score)
+
+        # ring 하나에서 나온 block을 buffer에 한번에 씀
+        n = 0
+        for ring in self.rings:
+            records = ring.drain()
+            if len(records):
+                self.memory.store_transitions(records['state'], records['action'], records['reward'],
+                                              records['new_state'], records['terminal'])
+                n += len(records)
+        self.total_steps += n
+        return n
+
+    def check_workers(self):
+        # 죽은 worker는 ring을 더 채우지 않으므로, 기다리는 쪽이 끝나지 않게 여기서 raise
+        for worker in self.workers:
+            if worker.exitcode not in (None, 0):
+                raise RuntimeError('rollout worker {} exited with code {}'.format(
+                    worker.name, worker.exitcode))
+        return bool(self.workers) and all(worker.exitcode is not None for worker in self.workers)
+
+    def step(self, learn=True):
+        # drain the rings and run the learn steps they are due; returns the
+        # number of new transitions
+        exited = self.check_workers()
+        n_games = len(self.score_history)
+        n = self.drain()
+        if exited and n == 0 and len(self.score_history) == n_games:
+            # 모든 worker가 (남은 에피소드 없이) 끝났고 더 받을 것도 없음
+            raise RuntimeError('all rollout workers have exited')
+        self.pending += n
+        self.pending += n
+        while self.pending >= self.learn_every:
+            self.pending -= self.learn_every
+            if not learn:
+                continue
+            self.maddpg.learn(self.memory)
+            self.learn_steps += 1
+            if self.learn_steps % self.broadcast_every == 0:
+                self.broadcast()
+        return n
+
+    def run(self, total_steps, learn=True):
+        self.start()
+        try:
+            while self.total_steps < total_steps and not self.force_stop:
+                if self.step(learn) == 0:
+                    time.sleep(0.001)
+        finally:
+            self.close()
+
+    def close(self):
+        self.stop.set()
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
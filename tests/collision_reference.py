@@ -0,0 +1,49 @@
+"""Pairwise collision resolver MAACEnv.step used before CollisionEngine, and
+random instances to check the engine against it (tests/test_collisions.py,
+benchmarks/collisions.py)."""
+import numpy as np
+
+from environment import MAACEnv, move_table
+
+
+def reference(pos, new_pos, blocked):
+    # MAACEnv.step의 이전 충돌 처리: 모든 쌍 비교 + 재귀 rewind
+    agents = [{'pos': p, 'new_pos': q} for p, q in zip(pos, new_pos)]
+
+    def rewind(agent):
+        agent['new_pos'] = agent['pos']
+        for other in agents:
+            if other is agent or other['pos'] == other['new_pos']:
+                continue
+            if other['new_pos'] == agent['pos']:
+                rewind(other)
+
+    for i, a in enumerate(agents):
+        if blocked[i]:
+            rewind(a)
+    collided = set()
+    for i, a in enumerate(agents):
+        for j, b in enumerate(agents):
+            if i >= j:
+                continue
+            if a['pos'] == b['new_pos'] and a['new_pos'] == b['pos']:
+                collided.add(i)
+                collided.add(j)
+                continue
+            if a['new_pos'] == b['new_pos']:
+                collided.add(i)
+                collided.add(j)
+    for i in tuple(collided):
+        rewind(agents[i])
+    return [a['new_pos'] for a in agents], sorted(collided)
+
+
+def instance(n_agents, size, rng):
+    # (pos, new_pos, blocked) flat cell indices, new_pos == pos where blocked
+    obstacle_layer = (rng.random((size, size)) < 0.1).astype(np.float64)
+    free = np.flatnonzero(obstacle_layer.ravel() == 0)
+    pos = rng.choice(free, n_agents, replace=False)
+    actions = rng.integers(0, 5, n_agents)
+    blocked = (move_table(obstacle_layer).ravel()[pos] >> actions) & 1 == 0
+    offset = np.array([dr * size + dc for dr, dc in (MAACEnv.ACTIONS[a] for a in range(5))])
+    return pos, np.where(blocked, pos, pos + offset[actions]), blocked
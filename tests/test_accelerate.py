@@ -0,0 +1,58 @@
+import tempfile
+
+import numpy as np
+import pytest
+import torch as T
+
+from maddpg import MADDPG
+
+# (accelerate, bf16, 출력 max abs 차이, gradient 상대 L2 차이) eager float32 대비,
+# benchmarks/accelerate.py와 같은 허용치 (torch.compile은 느려서 benchmark에서만)
+VARIANTS = [
+    ('script', False, 1e-5, 1e-3),
+    (None, True, 5e-2, 5e-2),
+    ('script', True, 5e-2, 5e-2),
+]
+
+
+def make_maddpg(ensemble, accelerate=None, bf16=False):
+    T.manual_seed(0) # eager와 같은 weight
+    return MADDPG([16]*3, 48, 3, 5, chkpt_dir=tempfile.mkdtemp() + '/',
+                  ensemble=ensemble, accelerate=accelerate, bf16=bf16)
+
+
+def outputs(maddpg, states, actions):
+    # actor/critic 출력과 critic loss의 gradient
+    critics = [maddpg.ensemble.critic] if maddpg.ensemble is not None else [agent.critic for agent in maddpg.agents]
+    pi = maddpg.act('actor', states)
+    q = maddpg.evaluate('critic', states, actions)
+    grads = T.autograd.grad(q.pow(2).mean(), [p for critic in critics for p in critic.parameters()])
+    return pi.detach(), q.detach(), T.cat([g.reshape(-1) for g in grads])
+
+
+def jit_autocast_mode():
+    mode = T._C._jit_set_autocast_mode(True)
+    T._C._jit_set_autocast_mode(mode)
+    return mode
+
+
+@pytest.mark.parametrize('ensemble', [False, True])
+@pytest.mark.parametrize('accelerate, bf16, atol, grad_rtol', VARIANTS)
+def test_accelerated_matches_eager(ensemble, accelerate, bf16, atol, grad_rtol):
+    rng = np.random.default_rng(0)
+    states = T.as_tensor((rng.random((64, 48)) < 0.5).astype(np.float32))
+    actions = T.as_tensor(rng.random((64, 15)).astype(np.float32)).expand(3, -1, -1)
+    jit_mode = jit_autocast_mode()
+
+    pi, q, grads = outputs(make_maddpg(ensemble), states, actions)
+    # 두 번: 처음은 graph를 만들면서, 다음은 만든 graph로
+    accelerated = make_maddpg(ensemble, accelerate, bf16)
+    for _ in range(2):
+        pi_, q_, grads_ = outputs(accelerated, states, actions)
+        assert pi_.dtype == q_.dtype == T.float32
+        assert (pi_ - pi).abs().max() <= atol
+        assert (q_ - q).abs().max() <= atol
+        assert (grads_ - grads).norm() <= grad_rtol * grads.norm()
+
+    # TorchScript autocast 설정은 실행하는 동안만 바뀜
+    assert jit_autocast_mode() == jit_mode
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from environment import MAACEnv, BatchedMAACEnv
+
+
+def make_envs(num_envs, seed, **kwargs):
+    # 같은 seed로 만들면 같은 (무작위) 에이전트, 먼지, 장애물 위치
+    np.random.seed(seed)
+    return [MAACEnv(n_agent=3, n_row=7, n_col=9, **kwargs) for _ in range(num_envs)]
+
+
+@pytest.mark.parametrize('grid', MAACEnv.GRIDS)
+@pytest.mark.parametrize('obs_mode', MAACEnv.OBS_MODES)
+def test_batched_matches_independent_envs(grid, obs_mode):
+    num_envs = 4
+    kwargs = {'obs_mode': obs_mode, 'grid': grid}
+    batched = BatchedMAACEnv(envs=make_envs(num_envs, seed=7, **kwargs))
+    envs = make_envs(num_envs, seed=7, **kwargs)
+
+    observations = batched.reset()
+    for e, env in enumerate(envs):
+        assert np.array_equal(observations[e], env.reset())
+
+    rng = np.random.default_rng(0)
+    for t in range(300):
+        actions = rng.random((num_envs, batched.n_agent, 5))
+        observations, rewards, dones, _ = batched.step(actions)
+        for e, env in enumerate(envs):
+            obs, reward, done, _ = env.step(actions[e])
+            assert np.array_equal(observations[e], obs), (t, e)
+            assert rewards[e].tolist() == reward, (t, e)
+            assert dones[e].tolist() == done, (t, e)
+            assert np.array_equal(batched.new_pos[e], env.get_positions()), (t, e)
+            assert np.array_equal(np.asarray(batched.dirty_layer[e]), np.asarray(env.dirty_layer)), (t, e)
+            assert np.array_equal(np.asarray(batched.visited_layer[e]), np.asarray(env.visited_layer)), (t, e)
+            assert batched.n_dirty[e] == env.n_dirty
+            assert np.array_equal(batched.get_action_mask()[e], env.get_action_mask()), (t, e)
+
+        # 끝난 env와 가끔 하나 더 reset
+        ids = np.flatnonzero(batched.done)
+        if t % 50 == 49:
+            ids = np.union1d(ids, [t % num_envs])
+        if len(ids):
+            observations = batched.reset(ids)
+            for e in ids:
+                assert np.array_equal(observations[e], envs[e].reset())
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import environment
+from collision import CollisionEngine, PAIRWISE_AGENTS
+from environment import MAACEnv
+from tests.collision_reference import instance, reference
+
+
+def instances(n_agents, seed, number=50):
+    size = max(5, int(np.ceil(np.sqrt(n_agents * 4 / 0.9))))
+    rng = np.random.default_rng(seed)
+    return size, [instance(n_agents, size, rng) for _ in range(number)]
+
+
+@pytest.mark.parametrize('n_agents', [1, 2, 3, 10, PAIRWISE_AGENTS, PAIRWISE_AGENTS + 1, 100, 500])
+def test_resolve_matches_pairwise(n_agents):
+    size, cases = instances(n_agents, seed=n_agents)
+    engine = CollisionEngine(size * size)
+    for pos, new_pos, blocked in cases:
+        expected, expected_collided = reference(pos.tolist(), new_pos.tolist(), blocked.tolist())
+        resolved, collided = engine.resolve(pos, new_pos, blocked)
+        assert resolved.tolist() == expected
+        assert np.flatnonzero(collided).tolist() == expected_collided
+        # resolve가 쓰고 나서 occupancy 배열을 비워 두는지
+        assert (engine.cell == -1).all()
+
+
+@pytest.mark.parametrize('n_agents', [1, 2, 3, 10, PAIRWISE_AGENTS])
+def test_resolve_pairs_matches_pairwise(n_agents):
+    size, cases = instances(n_agents, seed=1000 + n_agents)
+    engine = CollisionEngine(size * size)
+    for pos, new_pos, blocked in cases:
+        pos, new_pos, blocked = pos.tolist(), new_pos.tolist(), blocked.tolist()
+        expected, expected_collided = reference(pos, new_pos, blocked)
+        resolved, collided = engine.resolve_pairs(pos, new_pos, blocked)
+        assert resolved == expected
+        assert [i for i, c in enumerate(collided) if c] == expected_collided
+
+
+@pytest.mark.parametrize('n_agent', [3, 10])
+def test_env_step_same_with_either_resolver(monkeypatch, n_agent):
+    # MAACEnv.step는 에이전트 수에 따라 resolve_pairs/resolve를 고르므로 둘 다 같은 episode를 만들어야 함
+    rng = np.random.default_rng(n_agent)
+    actions = [np.eye(5)[rng.integers(0, 5, n_agent)] for _ in range(200)]
+
+    def rollout():
+        np.random.seed(0) # 에이전트, 먼지 위치
+        env = MAACEnv(n_agent=n_agent, n_row=8, n_col=8, obstacle_pos=[(3, 3), (3, 4), (5, 1)])
+        env.reset()
+        history = []
+        for action in actions:
+            _, rewards, _, _ = env.step(action)
+            history.append((env.get_positions().tolist(), rewards))
+        return history
+
+    pairwise = rollout()
+    monkeypatch.setattr(environment, 'PAIRWISE_AGENTS', 0)
+    assert rollout() == pairwise
@@ -0,0 +1,125 @@
+"""Headless training: no Tk, no per-step render or print.
+
+    python train.py --scenario scenario.json --log-file train.jsonl
+    python train.py --rows 15 --cols 15 --agents 4 --save-scenario scenario.json
+    python train.py --scenario scenario.json --live 6000
+
+Scenario files are json written by MAACEnv.scenario(): n_row, n_col and lists
+of [row, col] for agents, obstacles and dirty cells; missing entries are random.
+With --live, `python main.py --attach localhost:6000` (or the GUI menu) opens a
+viewer on the running job.
+"""
+import argparse
+import json
+
+from environment import MAACEnv
+from live import LiveServer, parse_address
+from main import Main
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='headless MADDPG training')
+    parser.add_argument('--scenario', help='scenario json file')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--agents', type=int, default=3)
+    parser.add_argument('--max-agents', type=int, default=10, help='cap on the number of agents, 0 for none')
+    parser.add_argument('--save-scenario', help='write the (possibly random) scenario to this file')
+    parser.add_argument('--obs-mode', choices=MAACEnv.OBS_MODES, default='dense',
+                        help="'compact': coordinates, local windows and a downsampled dirt map")
+    parser.add_argument('--obs-window', type=int, default=5, help='compact window size (odd)')
+    parser.add_argument('--dirt-map', type=int, default=8, help='compact dirt map blocks per side')
+    parser.add_argument('--grid', choices=MAACEnv.GRIDS, default='dense',
+                        help="'bits': bit-packed obstacle/dirty layers and int8 agent layers for large maps")
+    parser.add_argument('--games', type=int, default=Main.N_GAMES)
+    parser.add_argument('--max-steps', type=int, default=Main.MAX_STEPS)
+    parser.add_argument('--evaluate', action='store_true')
+    parser.add_argument('--fresh', action='store_true', help='do not load the checkpoint')
+    parser.add_argument('--chkpt-dir')
+    parser.add_argument('--workers', type=int, default=0, help='parallel rollout workers')
+    parser.add_argument('--ensemble', action='store_true')
+    parser.add_argument('--shared', action='store_true',
+                        help='one actor and critic shared by all agents (parameter sharing)')
+    parser.add_argument('--network', choices=('mlp', 'cnn', 'embed'), default='mlp',
+                        help="'cnn': shared convolutional encoder over the map layers (dense obs only), "
+                             "'embed': separate embeddings of the compact obs segments (compact obs only)")
+    parser.add_argument('--accelerate', choices=('script', 'compile'),
+                        help='run actor/critic forward passes as TorchScript traces or torch.compile graphs')
+    parser.add_argument('--bf16', action='store_true', help='bfloat16 autocast on CPU')
+    parser.add_argument('--action-mask', action='store_true',
+                        help='never pick moves into walls or obstacles (exploration only, learning is unmasked)')
+    parser.add_argument('--buffer-dtype', default='bits', help="'bits', 'uint8', 'float32' or 'dense'")
+    parser.add_argument('--buffer-on-disk', action='store_true')
+    parser.add_argument('--prioritized', action='store_true', help='not with --buffer-on-disk')
+    parser.add_argument('--prefetch', action='store_true')
+    parser.add_argument('--log-file', help='append progress records as json lines')
+    parser.add_argument('--log-interval', type=int, default=Main.PRINT_INTERVAL, help='episodes')
+    parser.add_argument('--live', help='[host:]port for GUI viewers to attach to (bare port: localhost only)')
+    parser.add_argument('--live-key', help='key viewers must present (default: $MAAC_LIVE_AUTHKEY, else random)')
+    parser.add_argument('--render-period', type=int, default=1,
+                        help='send every n-th episode to an attached viewer')
+    parser.add_argument('--record', help='directory to record episode trajectories to (see replay.py)')
+    parser.add_argument('--record-period', type=int, default=1, help='record every n-th episode')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every phase of the loop and report it every log interval')
+    parser.add_argument('--profile-file', help='append phase timings here (.json lines or .csv)')
+    parser.add_argument('--profile-episode', type=int, help='run torch.profiler/cProfile from this episode')
+    parser.add_argument('--profile-episodes', type=int, default=1)
+    parser.add_argument('--profile-tool', choices=('torch', 'cprofile'), default='torch')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    obs_args = {'obs_mode': args.obs_mode, 'obs_window': args.obs_window, 'dirt_map': args.dirt_map,
+                'max_agents': args.max_agents or None, 'grid': args.grid}
+    if args.scenario is not None:
+        with open(args.scenario) as f:
+            env = MAACEnv.from_scenario(json.load(f), **obs_args)
+    else:
+        env = MAACEnv(n_agent=args.agents, n_row=args.rows, n_col=args.cols, **obs_args)
+    if args.save_scenario is not None:
+        with open(args.save_scenario, 'w') as f:
+            json.dump(env.scenario(), f)
+
+    runner = Main(env)
+    runner.N_GAMES = args.games
+    runner.MAX_STEPS = args.max_steps
+    runner.evaluate = args.evaluate
+    runner.load_chkpt = not args.fresh
+    if args.chkpt_dir is not None:
+        runner.chkpt_dir = args.chkpt_dir
+    runner.rollout_workers = args.workers
+    runner.ensemble = args.ensemble
+    runner.network = args.network
+    runner.shared_params = args.shared
+    runner.accelerate = args.accelerate
+    runner.bf16 = args.bf16
+    runner.action_mask = args.action_mask
+    runner.buffer_obs_dtype = None if args.buffer_dtype == 'dense' else args.buffer_dtype
+    runner.buffer_on_disk = args.buffer_on_disk
+    runner.prioritized_replay = args.prioritized
+    runner.prefetch_batches = args.prefetch
+    runner.log_file = args.log_file
+    runner.log_interval = args.log_interval
+    runner.game_render_period = args.render_period
+    runner.record_dir = args.record
+    runner.record_period = args.record_period
+    runner.profile = args.profile or args.profile_file is not None
+    runner.profile_file = args.profile_file
+    runner.profile_episode = args.profile_episode
+    runner.profile_episodes = args.profile_episodes
+    runner.profile_tool = args.profile_tool
+    if args.live is not None:
+        runner.frames = LiveServer(parse_address(args.live), env.scenario(), authkey=args.live_key).frames
+
+    runner.prepare()
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        runner.save_checkpoint()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+
+class TrajectoryRecorder:
+    """Records episodes as an append-only directory of chunk files.
+
+    directory/scenario.json holds the env (MAACEnv.scenario()), and each
+    directory/chunk_XXXXXX.npz holds up to chunk_size episodes:
+        episodes       (E,)          episode numbers
+        frame_offsets  (E+1,)        episode e is frames frame_offsets[e]:frame_offsets[e+1]
+        positions      (F, A, 2)     int16 agent positions, frame 0 is right after reset
+        rewards        (F, A)        reward received on reaching the frame (0 for frame 0)
+        clean_offsets  (E+1,)        same for cleaned
+        cleaned        (N, 4)        int16 (frame, agent, row, col) cleaning events
+    Nothing is rendered or kept beyond the current chunk, so recording stays off
+    the training hot path.
+    """
+    def __init__(self, directory, scenario, chunk_size=100):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        with open(os.path.join(directory, 'scenario.json'), 'w') as f:
+            json.dump(scenario, f)
+
+        # 이어서 기록하면 다음 번호부터
+        self.n_chunks = len(chunk_files(directory))
+        self.clear()
+        self.positions = None
+
+    def clear(self):
+        self.chunk = {'episodes': [], 'positions': [], 'rewards': [], 'cleaned': []}
+
+    def start_episode(self, episode, positions):
+        self.episode = episode
+        self.positions = [positions]
+        self.rewards = [np.zeros(len(positions))]
+        self.cleaned = []
+
+    def record_step(self, positions, rewards, cleaned):
+        # cleaned: [(agent, row, col)] as in MAACEnv.cleaned
+        frame = len(self.positions)
+        self.positions.append(positions)
+        self.rewards.append(rewards)
+        for event in cleaned:
+            self.cleaned.append((frame,) + tuple(event))
+
+    def end_episode(self):
+        if self.positions is None:
+            return
+        self.chunk['episodes'].append(self.episode)
+        self.chunk['positions'].append(np.array(self.positions, dtype=np.int16))
+        self.chunk['rewards'].append(np.array(self.rewards, dtype=np.float32))
+        self.chunk['cleaned'].append(np.array(self.cleaned, dtype=np.int16).reshape(-1, 4))
+        self.positions = None
+        if len(self.chunk['episodes']) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.chunk['episodes']:
+            return
+        path = os.path.join(self.directory, 'chunk_{:06d}.npz'.format(self.n_chunks))
+        tmp_path = os.path.join(self.directory, 'tmp_chunk.npz')
+        np.savez(tmp_path,
+                 episodes=np.array(self.chunk['episodes'], dtype=np.int64),
+                 frame_offsets=offsets(self.chunk['positions']),
+                 positions=np.concatenate(self.chunk['positions']),
+                 rewards=np.concatenate(self.chunk['rewards']),
+                 clean_offsets=offsets(self.chunk['cleaned']),
+                 cleaned=np.concatenate(self.chunk['cleaned']))
+        os.replace(tmp_path, path)
+        self.n_chunks += 1
+        self.clear()
+
+    def close(self):
+        self.end_episode()
+        self.flush()
+
+
+class Trajectory:
+    """One recorded episode; frame(t) rebuilds the full state at frame t."""
+    def __init__(self, scenario, episode, positions, rewards, cleaned):
+        self.episode = episode
+        self.positions = positions
+        self.rewards = rewards
+        self.cleaned = cleaned
+        self.n_row = scenario['n_row']
+        self.n_col = scenario['n_col']
+
+        self.dirty_layer = np.zeros((self.n_row, self.n_col))
+        for row, col in scenario['dirty']:
+            self.dirty_layer[row, col] = 1
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def score(self):
+        return float(self.rewards.sum())
+
+    def frame(self, t):
+        # 기록된 state를 다시 계산하지 않고 위치/청소 이벤트만 재생
+        t = min(max(t, 0), len(self) - 1)
+        visited_layer = -np.ones((self.n_row, self.n_col))
+        for positions in self.positions[:t+1]:
+            visited_layer[positions[:, 0], positions[:, 1]] = np.arange(len(positions))
+
+        dirty_layer = self.dirty_layer.copy()
+        cleaned = self.cleaned[self.cleaned[:, 0] <= t]
+        dirty_layer[cleaned[:, 2], cleaned[:, 3]] = 0
+
+        return {
+            'episode': self.episode,
+            'steps': t,
+            'agent_pos': [tuple(pos) for pos in self.positions[t].tolist()],
+            'cells': np.arange(self.n_row * self.n_col),
+            'visited': visited_layer.ravel(),
+            'dirty': dirty_layer.ravel(),
+        }
+
+
+class TrajectoryReader:
+    """Random access to the episodes written by TrajectoryRecorder."""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'scenario.json')) as f:
+            self.scenario = json.load(f)
+
+        self.chunks = chunk_files(directory)
+        self.index = {}
+        for chunk_idx, path in enumerate(self.chunks):
+            with np.load(path) as chunk:
+                for i, episode in enumerate(chunk['episodes']):
+                    self.index[int(episode)] = (chunk_idx, i)
+        self.episodes = sorted(self.index)
+        self._loaded = (None, None)
+
+    def load_chunk(self, chunk_idx):
+        if self._loaded[0] != chunk_idx:
+            with np.load(self.chunks[chunk_idx]) as chunk:
+                self._loaded = (chunk_idx, dict(chunk))
+        return self._loaded[1]
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def __getitem__(self, episode):
+        chunk_idx, i = self.index[episode]
+        chunk = self.load_chunk(chunk_idx)
+        frames = slice(chunk['frame_offsets'][i], chunk['frame_offsets'][i+1])
+        events = slice(chunk['clean_offsets'][i], chunk['clean_offsets'][i+1])
+        return Trajectory(self.scenario, episode, chunk['positions'][frames].astype(np.int64),
+                          chunk['rewards'][frames], chunk['cleaned'][events].astype(np.int64))
+
+
+def chunk_files(directory):
+    return sorted(glob.glob(os.path.join(directory, 'chunk_[0-9]*.npz')))
+
+
+def offsets(arrays):
+    return np.cumsum([0] + [len(a) for a in arrays]).astype(np.int64)